@@ -24,16 +24,43 @@ class DQNAgent:
         self.epsilon = self.config['epsilon_start']
         self.steps_done = 0
 
-    def select_action(self, state, eval_mode=False):
-        # State is numpy array
+    def select_action(self, state, eval_mode=False, action_mask=None):
+        # State is numpy array; action_mask restricts the choice to valid joins
         if not eval_mode and random.random() < self.epsilon:
+            if action_mask is not None:
+                return int(random.choice(np.flatnonzero(action_mask)))
             return random.randrange(self.action_dim)
         
         with torch.no_grad():
             state_t = torch.FloatTensor(state).unsqueeze(0).to(self.device)
             q_values = self.policy_net(state_t)
+            if action_mask is not None:
+                q_values = q_values.masked_fill(~torch.as_tensor(action_mask, dtype=torch.bool, device=self.device), float('-inf'))
             return q_values.argmax().item()
 
+    def select_actions(self, states, action_masks=None, eval_mode=False):
+        """
+        select_action for a batch of states (VectorQueryEnv) with one forward
+        pass. states: (B, state_dim); action_masks: (B, action_dim) or None.
+        returns:
+            np.array of B actions
+        """
+        with torch.no_grad():
+            states_t = torch.FloatTensor(states).to(self.device)
+            q_values = self.policy_net(states_t)
+            if action_masks is not None:
+                q_values = q_values.masked_fill(~torch.as_tensor(action_masks, dtype=torch.bool, device=self.device), float('-inf'))
+            actions = q_values.argmax(1).cpu().numpy()
+
+        if not eval_mode:
+            for i in range(len(actions)):
+                if random.random() < self.epsilon:
+                    if action_masks is not None:
+                        actions[i] = random.choice(np.flatnonzero(action_masks[i]))
+                    else:
+                        actions[i] = random.randrange(self.action_dim)
+        return actions
+
     def update_epsilon(self):
         self.steps_done += 1
         decay = self.config['epsilon_decay']
@@ -45,7 +72,7 @@ class DQNAgent:
         if len(self.memory) < self.config['batch_size']:
             return
 
-        state, action, reward, next_state, done = self.memory.sample(self.config['batch_size'])
+        state, action, reward, next_state, done, next_mask = self.memory.sample(self.config['batch_size'])
         
         state = torch.FloatTensor(state).to(self.device)
         action = torch.LongTensor(action).unsqueeze(1).to(self.device)
@@ -56,9 +83,16 @@ class DQNAgent:
         # Q(s, a)
         q_values = self.policy_net(state).gather(1, action)
 
-        # V(s') = max Q(s', a')
+        # V(s') = max Q(s', a') over the valid actions a' of s'
         with torch.no_grad():
-            next_q_values = self.target_net(next_state).max(1)[0].unsqueeze(1)
+            next_q_all = self.target_net(next_state)
+            if next_mask is not None:
+                next_mask = torch.as_tensor(next_mask, device=self.device)
+                next_q_all = next_q_all.masked_fill(~next_mask, float('-inf'))
+                # Terminal states have no valid action; their value is unused
+                next_q_values = torch.where(next_mask.any(1), next_q_all.max(1)[0], torch.zeros(1, device=self.device)).unsqueeze(1)
+            else:
+                next_q_values = next_q_all.max(1)[0].unsqueeze(1)
             target_q_values = reward + (1 - done) * self.config['gamma'] * next_q_values
 
         loss = F.smooth_l1_loss(q_values, target_q_values)
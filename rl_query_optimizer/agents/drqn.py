@@ -24,7 +24,7 @@ class DRQNAgent:
         self.epsilon = self.config['epsilon_start']
         self.steps_done = 0
 
-    def select_action(self, state, hidden, eval_mode=False):
+    def select_action(self, state, hidden, eval_mode=False, action_mask=None):
         # DRQN action selection usually involves the history. 
         # But here 'state' is the current observation.
         # 'hidden' is the hidden state (h, c) passed from previous step.
@@ -34,6 +34,8 @@ class DRQNAgent:
             with torch.no_grad():
                 state_t = torch.FloatTensor(state).unsqueeze(0).unsqueeze(0).to(self.device) # (1, 1, feat)
                 _, next_hidden = self.policy_net(state_t, hidden)
+            if action_mask is not None:
+                return int(random.choice(np.flatnonzero(action_mask))), next_hidden
             return random.randrange(self.action_dim), next_hidden
         
         with torch.no_grad():
@@ -41,7 +43,10 @@ class DRQNAgent:
             # Forward one step
             q_values, next_hidden = self.policy_net(state_t, hidden)
             # q_values shape: (1, 1, actions)
-            return q_values.squeeze().argmax().item(), next_hidden
+            q_values = q_values.reshape(-1)
+            if action_mask is not None:
+                q_values = q_values.masked_fill(~torch.as_tensor(action_mask, dtype=torch.bool, device=self.device), float('-inf'))
+            return q_values.argmax().item(), next_hidden
 
     def update_epsilon(self):
         self.steps_done += 1
@@ -55,7 +60,7 @@ class DRQNAgent:
             return
 
         # Sample sequences
-        state, action, reward, next_state, done, mask = self.memory.sample(self.config['batch_size'])
+        state, action, reward, next_state, done, mask, next_mask = self.memory.sample(self.config['batch_size'])
         
         state = torch.FloatTensor(state).to(self.device) # (B, Seq, Feat)
         action = torch.LongTensor(action).unsqueeze(-1).to(self.device) # (B, Seq, 1)
@@ -73,7 +78,13 @@ class DRQNAgent:
         # Target values
         with torch.no_grad():
             next_q_values_seq, _ = self.target_net(next_state)
-            next_max_q = next_q_values_seq.max(-1)[0].unsqueeze(-1)
+            if next_mask is not None:
+                # Max over the valid actions of s'; terminal states have none
+                next_mask = torch.as_tensor(next_mask, device=self.device)
+                next_q_values_seq = next_q_values_seq.masked_fill(~next_mask, float('-inf'))
+                next_max_q = torch.where(next_mask.any(-1), next_q_values_seq.max(-1)[0], torch.zeros(1, device=self.device)).unsqueeze(-1)
+            else:
+                next_max_q = next_q_values_seq.max(-1)[0].unsqueeze(-1)
             target_q_values = reward + (1 - done) * self.config['gamma'] * next_max_q
 
         # Masked loss (don't train on padding)
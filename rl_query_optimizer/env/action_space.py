@@ -0,0 +1,76 @@
+import functools
+import numpy as np
+
+class PairActions:
+    """
+    Lookup tables between discrete actions and table pairs (i < j), in the
+    order of the upper triangle: 0 -> (0, 1), 1 -> (0, 2), ...
+
+    action_to_pair: int16 array (num_actions, 2)
+    pair_to_action: int32 array (max_tables, max_tables), symmetric,
+                    -1 on the diagonal
+    Both accept arrays, so whole batches are decoded with one indexing op.
+    """
+
+    def __init__(self, max_tables):
+        self.max_tables = max_tables
+        rows, cols = np.triu_indices(max_tables, k=1)
+        self.num_actions = len(rows)
+
+        self.action_to_pair = np.stack([rows, cols], axis=1).astype(np.int16)
+        self.pair_to_action = np.full((max_tables, max_tables), -1, dtype=np.int32)
+        self.pair_to_action[rows, cols] = np.arange(self.num_actions)
+        self.pair_to_action[cols, rows] = np.arange(self.num_actions)
+        self.action_to_pair.setflags(write=False)
+        self.pair_to_action.setflags(write=False)
+        self._rows = rows
+        self._cols = cols
+        self._bit_shifts = np.arange(max_tables, dtype=np.uint64)
+
+    def pairs(self, actions):
+        """
+        (i, j) arrays for an array of actions.
+        """
+        pairs = self.action_to_pair[np.asarray(actions)]
+        return pairs[..., 0], pairs[..., 1]
+
+    def actions(self, i, j):
+        """
+        Actions for arrays of table indices; -1 where i == j.
+        """
+        return self.pair_to_action[np.asarray(i), np.asarray(j)]
+
+    def edge_mask(self, edges):
+        """
+        Boolean mask of the actions that are join graph edges [(i, j), ...].
+        """
+        mask = np.zeros(self.num_actions, dtype=bool)
+        if edges:
+            i, j = np.asarray(edges).T
+            mask[self.actions(i, j)] = True
+        return mask
+
+    def join_mask(self, joined_mask, num_tables, edge_mask=None):
+        """
+        Valid actions for a left-deep join state given as a bitmask: the
+        first action joins any two tables of the query, every later one
+        joins a joined table with a table that is not joined yet. With an
+        `edge_mask`, only pairs connected by a join predicate are allowed,
+        unless none is left (the query needs a cross product).
+        """
+        joined = ((np.uint64(joined_mask) >> self._bit_shifts) & np.uint64(1)).astype(bool)
+        candidates = self._cols < num_tables
+        if joined_mask:
+            candidates &= joined[self._rows] != joined[self._cols]
+        if edge_mask is not None:
+            connected = candidates & edge_mask
+            if connected.any():
+                return connected
+        return candidates
+
+@functools.lru_cache(maxsize=None)
+def get_pair_actions(max_tables):
+    """
+    Shared PairActions for a table count, built once per process.
+    """
+    return PairActions(max_tables)
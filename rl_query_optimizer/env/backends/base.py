@@ -0,0 +1,114 @@
+import contextlib
+
+class StatementTimeout(Exception):
+    """
+    Raised when an EXPLAIN ANALYZE run exceeds its statement timeout.
+    """
+    pass
+
+class CostBackend:
+    """
+    Produces EXPLAIN output for hinted queries on behalf of CostInterface.
+
+    CostInterface owns hint generation, caching and penalties; a backend only
+    has to turn one hinted query into a plan in PostgreSQL's EXPLAIN (FORMAT JSON)
+    shape, i.e. a list holding a dict with a 'Plan' node.
+    """
+
+    # True if explain_many can cost several hints in one call
+    batched = False
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        """
+        args:
+            query: hinted query text, e.g. "/*+ Leading(t mc) */\nSELECT ..."
+            join_order: the join order the hint was generated from
+            analyze: execute the query (EXPLAIN ANALYZE) to get 'Execution Time'
+            timeout_ms: abort an analyzed run after this long with StatementTimeout
+            settings: planner settings for this statement only, e.g. {"enable_hashjoin": "off"}
+        returns:
+            EXPLAIN JSON as a list/dict or a JSON string
+        """
+        raise NotImplementedError
+
+    def explain_arms(self, query, arm_settings, join_order=None, analyze=False, timeout_ms=None):
+        """
+        EXPLAIN output of one query under each of several planner settings.
+        A failed arm yields the exception it raised instead of a plan.
+        """
+        return explain_each(self.explain, query, arm_settings, join_order, analyze, timeout_ms)
+
+    @contextlib.contextmanager
+    def measurement_slot(self, max_concurrent):
+        """
+        Holds one of `max_concurrent` slots for an EXPLAIN ANALYZE measurement
+        and yields the MeasurementSession to run it (and sample the server
+        load) on. A backend with a server enforces the limit there, so it
+        holds for every process measuring against that server. Without one
+        there is nothing to contend for and no slot is taken.
+        """
+        yield MeasurementSession(self)
+
+    def explain_many(self, hints, sql_query_template):
+        """
+        Total costs for several hints of one query in one call, or None if the
+        backend has no batched path. Failed entries are None.
+        """
+        return None
+
+    def stats_version(self):
+        """
+        Identifier that changes whenever the statistics behind the costs change.
+        """
+        return None
+
+    def server_load(self):
+        """
+        Current server load as {"active_backends", "blks_hit", "blks_read"}
+        (the block counters cumulative), or None if the backend has no server.
+        """
+        return None
+
+    def cancel(self, thread_id):
+        """
+        Abort the statement a worker thread is currently running, if any.
+        """
+        pass
+
+class MeasurementSession:
+    """
+    Where one measurement runs: explain, explain_arms and the server_load
+    samples around it go to the same connection when the backend has one.
+    This default forwards to the backend itself.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        return self.backend.explain(query, join_order, analyze=analyze, timeout_ms=timeout_ms, settings=settings)
+
+    def explain_arms(self, query, arm_settings, join_order=None, analyze=False, timeout_ms=None):
+        return self.backend.explain_arms(query, arm_settings, join_order, analyze=analyze, timeout_ms=timeout_ms)
+
+    def server_load(self):
+        return self.backend.server_load()
+
+def explain_each(explain, query, arm_settings, join_order=None, analyze=False, timeout_ms=None):
+    """
+    explain_arms on top of a single-statement explain: one call per arm, a
+    failed arm yields its exception.
+    """
+    results = []
+    for settings in arm_settings:
+        try:
+            results.append(explain(query, join_order, analyze=analyze, timeout_ms=timeout_ms, settings=settings))
+        except Exception as e:
+            results.append(e)
+    return results
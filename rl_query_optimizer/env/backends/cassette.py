@@ -0,0 +1,183 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from .base import CostBackend, MeasurementSession, explain_each
+
+class CassetteMiss(LookupError):
+    """
+    Raised in replay mode for a query that was never recorded.
+    """
+    pass
+
+class CassetteBackend(CostBackend):
+    """
+    Records EXPLAIN responses of another backend into an append-only JSON
+    lines file and replays them without a database.
+
+    Each line is {"key": ..., "query": ..., "plan": ...}. The key is a hash of
+    the exact hinted query text, its planner settings and whether it was
+    analyzed, so a replay is deterministic. Timed out runs are not recorded.
+    The offset of every key is indexed when the file is opened, and replay
+    seeks straight to the line.
+
+    mode:
+        "record": forward to `inner` and append responses not yet recorded
+        "replay": answer from the file only; unknown queries raise CassetteMiss
+    """
+
+    def __init__(self, path, mode='replay', inner=None):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        if mode == 'record' and inner is None:
+            raise ValueError("Recording needs a backend to record from")
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.missed_queries = []
+
+        self._index = {} # key -> byte offset of its line
+        self._lock = threading.Lock()
+        self._file = None
+
+    def connect(self):
+        if self._file is not None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if self.mode == 'replay' and not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette {self.path} does not exist")
+        self._file = open(self.path, 'a+b')
+        self._build_index()
+        if self.inner is not None:
+            self.inner.connect()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if self.inner is not None:
+            self.inner.close()
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        return self._explain_with(self.inner.explain if self.inner is not None else None,
+                                  query, join_order, analyze, timeout_ms, settings)
+
+    @contextlib.contextmanager
+    def measurement_slot(self, max_concurrent):
+        # Recording measures on the inner backend's slot; a replay has no server
+        if self.mode != 'record':
+            yield MeasurementSession(self)
+            return
+        with self.inner.measurement_slot(max_concurrent) as inner_session:
+            yield _RecordingSession(self, inner_session)
+
+    def _explain_with(self, inner_explain, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        key = self._key(query, analyze, settings)
+        with self._lock:
+            plan = self._read(key)
+            if plan is not None:
+                self.hits += 1
+                return plan
+            if self.mode == 'replay':
+                self.misses += 1
+                self.missed_queries.append(query)
+                raise CassetteMiss(f"Query not recorded in {self.path}: {key}")
+
+        plan = inner_explain(query, join_order, analyze=analyze, timeout_ms=timeout_ms, settings=settings)
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self._append(key, query, plan)
+        return plan
+
+    def stats_version(self):
+        # A recording never changes underneath a replay
+        if self.mode == 'record':
+            return self.inner.stats_version()
+        return None
+
+    def server_load(self):
+        if self.mode == 'record':
+            return self.inner.server_load()
+        return None
+
+    def cancel(self, thread_id):
+        if self.inner is not None:
+            self.inner.cancel(thread_id)
+
+    def stats(self):
+        return {
+            "entries": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "recorded": self.recorded
+        }
+
+    @staticmethod
+    def _key(query, analyze=False, settings=None):
+        text = f"ANALYZE {query}" if analyze else query
+        if settings:
+            # Planner settings change the plan, so they are part of the key
+            text = "SET " + ",".join(f"{name}={value}" for name, value in sorted(settings.items())) + f" {text}"
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _build_index(self):
+        self._index = {}
+        self._file.seek(0)
+        offset = 0
+        line = b''
+        for line in self._file:
+            if line.endswith(b'\n'):
+                try:
+                    self._index.setdefault(json.loads(line)['key'], offset)
+                except (ValueError, KeyError):
+                    print(f"Skipping corrupt cassette line at byte {offset} in {self.path}")
+            offset += len(line)
+        if line and not line.endswith(b'\n') and self.mode == 'record':
+            # Terminate a line cut short by an interrupted run before appending
+            self._file.write(b'\n')
+            self._file.flush()
+
+    def _read(self, key):
+        offset = self._index.get(key)
+        if offset is None:
+            return None
+        self._file.seek(offset)
+        return json.loads(self._file.readline())['plan']
+
+    def _append(self, key, query, plan):
+        line = json.dumps({"key": key, "query": query, "plan": plan}, separators=(',', ':')) + "\n"
+        with self._lock:
+            if key in self._index:
+                return
+            self._file.seek(0, os.SEEK_END)
+            self._index[key] = self._file.tell()
+            self._file.write(line.encode('utf-8'))
+            self._file.flush()
+            self.recorded += 1
+
+class _RecordingSession(MeasurementSession):
+    """
+    Measurement session of a recording cassette: misses run on the inner
+    backend's measurement session and are recorded.
+    """
+
+    def __init__(self, cassette, inner_session):
+        super().__init__(cassette)
+        self.inner_session = inner_session
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        return self.backend._explain_with(self.inner_session.explain, query, join_order, analyze, timeout_ms, settings)
+
+    def explain_arms(self, query, arm_settings, join_order=None, analyze=False, timeout_ms=None):
+        return explain_each(self.explain, query, arm_settings, join_order, analyze, timeout_ms)
+
+    def server_load(self):
+        return self.inner_session.server_load()
@@ -0,0 +1,369 @@
+import contextlib
+import json
+import re
+import threading
+import time
+
+import psycopg2
+from .base import CostBackend, MeasurementSession, StatementTimeout
+from ..connection_pool import ConnectionPool, ReplicaSet
+
+# What the planner sees of the statistics, without when they were gathered:
+# row and page counts plus the pg_stats values. Changes whenever an ANALYZE
+# (manual or autovacuum) changes the statistics, but not with the ANALYZE
+# timestamps, so replicas restored from one snapshot agree on it. It is both
+# the replica check and the stats version that invalidates cached costs and
+# baselines; any replica may answer it.
+STATS_CONTENT_FINGERPRINT_SQL = """
+SELECT md5(
+    coalesce((SELECT string_agg(c.relname || ':' || c.reltuples::text || ':' || c.relpages::text,
+                                ',' ORDER BY c.relname)
+              FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+              WHERE n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname NOT LIKE 'pg_toast%'
+                AND c.relkind IN ('r', 'm', 'p')), '') || '|' ||
+    coalesce((SELECT string_agg(md5(concat_ws(':', s.schemaname, s.tablename, s.attname, s.inherited::text,
+                                              s.null_frac::text, s.avg_width::text, s.n_distinct::text,
+                                              s.most_common_vals::text, s.most_common_freqs::text,
+                                              s.histogram_bounds::text, s.correlation::text)),
+                                ',' ORDER BY s.schemaname, s.tablename, s.attname, s.inherited)
+              FROM pg_stats s
+              WHERE s.schemaname NOT IN ('pg_catalog', 'information_schema')), ''))
+"""
+
+# Other busy client sessions and cumulative buffer hits/reads of this database
+SERVER_LOAD_SQL = """
+SELECT json_build_object(
+    'active_backends', (SELECT count(*) FROM pg_stat_activity
+                        WHERE state = 'active' AND backend_type = 'client backend'
+                          AND pid <> pg_backend_pid()),
+    'blks_hit', d.blks_hit,
+    'blks_read', d.blks_read)
+FROM pg_stat_database d WHERE d.datname = current_database()
+"""
+
+# Replicas must agree on this to produce comparable plans
+SCHEMA_FINGERPRINT_SQL = """
+SELECT md5(coalesce(string_agg(
+    c.relname || '.' || a.attname || ':' || format_type(a.atttypid, a.atttypmod),
+    ',' ORDER BY c.relname, a.attnum), ''))
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+JOIN pg_attribute a ON a.attrelid = c.oid
+WHERE n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname NOT LIKE 'pg_toast%'
+  AND c.relkind IN ('r', 'i', 'm', 'p') AND a.attnum > 0 AND NOT a.attisdropped
+"""
+
+# Costs many hinted variants of one query in a single round trip. A variant
+# that fails to plan yields NULL instead of aborting the whole batch. The hint
+# comment ends with a newline, written as chr(10) so no escaping of this
+# f-string can turn it into a literal backslash.
+SERVER_BATCH_FUNCTION = "rlqo_explain_costs"
+SERVER_BATCH_SQL = f"""
+CREATE OR REPLACE FUNCTION {SERVER_BATCH_FUNCTION}(hints text[], query text)
+RETURNS float8[] LANGUAGE plpgsql AS $$
+DECLARE
+    hint text;
+    plan json;
+    costs float8[] := '{{}}';
+BEGIN
+    FOREACH hint IN ARRAY hints LOOP
+        BEGIN
+            EXECUTE 'EXPLAIN (FORMAT JSON) ' || hint || chr(10) || query INTO plan;
+            costs := costs || (plan->0->'Plan'->>'Total Cost')::float8;
+        EXCEPTION WHEN OTHERS THEN
+            costs := costs || NULL::float8;
+        END;
+    END LOOP;
+    RETURN costs;
+END;
+$$
+"""
+
+# First key of the session advisory locks that serve as measurement slots,
+# (MEASUREMENT_LOCK_SPACE, 0) .. (MEASUREMENT_LOCK_SPACE, max_concurrent - 1)
+MEASUREMENT_LOCK_SPACE = 0x726c716f
+
+# Setting names cannot be bound as parameters, so they are checked instead
+SETTING_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+
+def _as_statement_timeout(error):
+    """
+    StatementTimeout for a QueryCanceledError raised by statement_timeout,
+    or None for any other cancel (pg_cancel_backend, a client cancel or
+    Ctrl-C), which must not be taken for a slow plan.
+    """
+    message = str(error).strip()
+    if error.pgcode == '57014' and 'statement timeout' in message:
+        return StatementTimeout(message)
+    return None
+
+class PostgresBackend(CostBackend):
+    """
+    Costs queries with EXPLAIN on a live PostgreSQL through a connection pool.
+    With `database.replicas`, calls are spread over several instances holding
+    the same database (see ReplicaSet).
+    """
+
+    def __init__(self, db_config, server_batch=False):
+        self.db_config = db_config
+        self.batched = server_batch
+        self.pool = None
+        self._server_batch_ready = None # None until installation was attempted
+        # Connection currently executing a statement, per worker thread, so a
+        # timed out estimate can be cancelled on the server
+        self._active_conns = {}
+
+    def connect(self):
+        """
+        Opens the connection pool. Failures propagate to the caller.
+        """
+        if self.pool is None:
+            pool_config = self.db_config.get('pool', {})
+            pool_kwargs = dict(
+                min_size=pool_config.get('min_size', 1),
+                max_size=pool_config.get('max_size', 8),
+                health_check_interval=pool_config.get('health_check_interval', 30),
+                acquire_timeout=pool_config.get('acquire_timeout', 30)
+            )
+            replicas = self.db_config.get('replicas')
+            if replicas:
+                pool = ReplicaSet(
+                    self.db_config, replicas, pool_kwargs=pool_kwargs,
+                    eject_seconds=self.db_config.get('replica_eject_seconds', 60)
+                )
+                try:
+                    pool.verify([SCHEMA_FINGERPRINT_SQL, STATS_CONTENT_FINGERPRINT_SQL])
+                except Exception:
+                    pool.close()
+                    raise
+                self.pool = pool
+            else:
+                self.pool = ConnectionPool(self.db_config, **pool_kwargs)
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool = None
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        setup = self._setup_statements(settings, timeout_ms if analyze else None)
+        try:
+            return self._fetch_one(self._explain_sql(query, analyze), setup=setup)
+        except psycopg2.extensions.QueryCanceledError as e:
+            timeout = _as_statement_timeout(e)
+            if timeout is None:
+                raise
+            raise timeout from e
+
+    def explain_arms(self, query, arm_settings, join_order=None, analyze=False, timeout_ms=None):
+        """
+        Runs every arm on the same pooled connection, each in its own short
+        transaction whose SET LOCAL settings are rolled back afterwards.
+        """
+        if self.pool is None:
+            self.connect()
+        with self.pool.lease() as conn:
+            self._active_conns[threading.get_ident()] = conn
+            try:
+                return self._explain_arms_on(conn, query, arm_settings, analyze, timeout_ms)
+            finally:
+                self._active_conns.pop(threading.get_ident(), None)
+
+    @contextlib.contextmanager
+    def measurement_slot(self, max_concurrent):
+        """
+        Leases a connection and takes one of `max_concurrent` session advisory
+        locks on it, waiting until one is free. The locks live in the server,
+        so the limit holds across processes and CostInterfaces measuring on
+        the same instance (per replica with database.replicas). A lost
+        session releases its lock with it.
+        """
+        if self.pool is None:
+            self.connect()
+        with self.pool.lease() as conn:
+            slot = self._acquire_measurement_slot(conn, max(int(max_concurrent), 1))
+            self._active_conns[threading.get_ident()] = conn
+            try:
+                yield _PostgresMeasurementSession(self, conn)
+            finally:
+                self._active_conns.pop(threading.get_ident(), None)
+                if not conn.closed:
+                    try:
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT pg_advisory_unlock(%s, %s)", (MEASUREMENT_LOCK_SPACE, slot))
+                    except psycopg2.Error as e:
+                        print(f"Failed to release measurement slot {slot}: {e}")
+
+    def explain_many(self, hints, sql_query_template):
+        if self._server_batch_ready is None:
+            self._install_server_batch()
+        if not self._server_batch_ready:
+            return None
+        try:
+            return self._fetch_one(f"SELECT {SERVER_BATCH_FUNCTION}(%s, %s)", (hints, sql_query_template))
+        except Exception as e:
+            print(f"Server-side batch costing failed, falling back to per-statement EXPLAIN: {e}")
+            return None
+
+    def stats_version(self):
+        return self._fetch_one(STATS_CONTENT_FINGERPRINT_SQL)
+
+    def stats(self):
+        return self.pool.stats() if self.pool else {}
+
+    def server_load(self):
+        load = self._fetch_one(SERVER_LOAD_SQL)
+        return json.loads(load) if isinstance(load, str) else load
+
+    def _server_load_on(self, conn):
+        load = self._execute_on(conn, SERVER_LOAD_SQL)
+        return json.loads(load) if isinstance(load, str) else load
+
+    def _explain_on(self, conn, query, analyze=False, timeout_ms=None, settings=None):
+        setup = self._setup_statements(settings, timeout_ms if analyze else None)
+        try:
+            return self._execute_on(conn, self._explain_sql(query, analyze), setup=setup)
+        except psycopg2.extensions.QueryCanceledError as e:
+            timeout = _as_statement_timeout(e)
+            if timeout is None:
+                raise
+            raise timeout from e
+
+    def _explain_arms_on(self, conn, query, arm_settings, analyze=False, timeout_ms=None):
+        sql = self._explain_sql(query, analyze)
+        results = []
+        with conn.cursor() as cur:
+            for settings in arm_settings:
+                if conn.closed:
+                    results.append(psycopg2.InterfaceError("connection already closed"))
+                    continue
+                cur.execute("BEGIN")
+                try:
+                    for statement, statement_params in self._setup_statements(settings, timeout_ms if analyze else None):
+                        cur.execute(statement, statement_params)
+                    cur.execute(sql)
+                    results.append(cur.fetchone()[0])
+                except psycopg2.extensions.QueryCanceledError as e:
+                    timeout = _as_statement_timeout(e)
+                    if timeout is None:
+                        raise
+                    results.append(timeout)
+                except (psycopg2.Error, ValueError) as e:
+                    results.append(e)
+                finally:
+                    if not conn.closed:
+                        cur.execute("ROLLBACK")
+        return results
+
+    @staticmethod
+    def _acquire_measurement_slot(conn, max_concurrent):
+        delay = 0.01
+        with conn.cursor() as cur:
+            while True:
+                for slot in range(max_concurrent):
+                    cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (MEASUREMENT_LOCK_SPACE, slot))
+                    if cur.fetchone()[0]:
+                        return slot
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+    def cancel(self, thread_id):
+        conn = self._active_conns.get(thread_id)
+        if conn is not None:
+            try:
+                conn.cancel()
+            except psycopg2.Error as e:
+                print(f"Failed to cancel statement: {e}")
+
+    @staticmethod
+    def _explain_sql(query, analyze):
+        if not analyze:
+            # We use EXPLAIN (FORMAT JSON) to get cost without executing
+            # This is much faster than ANALYZE which actually runs the query.
+            return f"EXPLAIN (FORMAT JSON) {query}"
+        # TIMING OFF avoids per-node clock calls that inflate the measured runtime
+        return f"EXPLAIN (ANALYZE, FORMAT JSON, TIMING OFF) {query}"
+
+    @staticmethod
+    def _setup_statements(settings, timeout_ms=None):
+        setup = []
+        for name, value in (settings or {}).items():
+            if not SETTING_NAME_RE.match(name):
+                raise ValueError(f"Invalid planner setting name: {name!r}")
+            setup.append((f"SET LOCAL {name} = %s", (str(value),)))
+        if timeout_ms:
+            setup.append(("SET LOCAL statement_timeout = %s", (int(timeout_ms),)))
+        return setup
+
+    def _fetch_one(self, sql, params=None, setup=None):
+        """
+        Runs a single-value statement on a pooled connection. A connection
+        lost mid-statement is replaced by the pool and the statement retried once.
+        With `setup` statements (e.g. SET LOCAL), everything runs in a
+        transaction that is rolled back afterwards, so the session is unchanged.
+        """
+        if self.pool is None:
+            self.connect()
+        for attempt in range(2):
+            conn = None
+            try:
+                with self.pool.lease(check=attempt > 0) as conn:
+                    self._active_conns[threading.get_ident()] = conn
+                    try:
+                        return self._execute_on(conn, sql, params, setup)
+                    finally:
+                        self._active_conns.pop(threading.get_ident(), None)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                # Only retry when the server dropped the session, not on SQL errors
+                if attempt == 1 or conn is None or not conn.closed:
+                    raise
+
+    @staticmethod
+    def _execute_on(conn, sql, params=None, setup=None):
+        with conn.cursor() as cur:
+            if not setup:
+                cur.execute(sql, params)
+                return cur.fetchone()[0]
+            cur.execute("BEGIN")
+            try:
+                for statement, statement_params in setup:
+                    cur.execute(statement, statement_params)
+                cur.execute(sql, params)
+                return cur.fetchone()[0]
+            finally:
+                if not conn.closed:
+                    cur.execute("ROLLBACK")
+
+    def _install_server_batch(self):
+        try:
+            if self.pool is None:
+                self.connect()
+            if isinstance(self.pool, ReplicaSet):
+                self.pool.execute_all(SERVER_BATCH_SQL)
+            else:
+                with self.pool.lease() as conn:
+                    with conn.cursor() as cur:
+                        cur.execute(SERVER_BATCH_SQL)
+            self._server_batch_ready = True
+        except psycopg2.Error as e:
+            print(f"Could not install {SERVER_BATCH_FUNCTION}(), using per-statement EXPLAIN: {e}")
+            self._server_batch_ready = False
+
+class _PostgresMeasurementSession(MeasurementSession):
+    """
+    A measurement on the connection holding its slot: the ANALYZE run and
+    the load samples around it hit the same server session (and replica).
+    """
+
+    def __init__(self, backend, conn):
+        super().__init__(backend)
+        self.conn = conn
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        return self.backend._explain_on(self.conn, query, analyze, timeout_ms, settings)
+
+    def explain_arms(self, query, arm_settings, join_order=None, analyze=False, timeout_ms=None):
+        return self.backend._explain_arms_on(self.conn, query, arm_settings, analyze, timeout_ms)
+
+    def server_load(self):
+        return self.backend._server_load_on(self.conn)
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import math
+import re
+from .base import CostBackend, StatementTimeout
+from ...utils.sql_parser import SQLParser, local_filters
+from ...utils.stats_snapshot import CardinalityEstimator
+
+HINT_RE = re.compile(r'^\s*/\*\+.*?\*/\s*', re.DOTALL)
+COLUMN_RE = re.compile(r'^\s*(\w+)\.(\w+)\s*$')
+
+class SimulatedBackend(CostBackend):
+    """
+    In-process analytical cost model for left-deep join orders.
+
+    Cardinalities come from a statistics file with base table sizes and
+    optional per-predicate join selectivities:
+
+        {"tables": {"title": 2528312, "movie_info": 14835720},
+         "joins": {"movie_info.movie_id=title.id": 4.0e-7}}
+
+    Joins without an entry assume a key/foreign-key join (1 / larger table).
+    Alternatively `snapshot_path` points to a pg_stats snapshot written by
+    utils/stats_snapshot.py, whose CardinalityEstimator then provides filter
+    and join selectivities.
+    Tables missing from the join order are appended greedily like the planner
+    would, so a prefix is costed as the whole query with that prefix fixed.
+
+    model:
+        "c_out":     sum of intermediate result sizes
+        "hash_join": scans + hash build on the inner + probe with the outer + output.
+                     Each join uses the cheapest of `join_methods` (hash, merge,
+                     nestloop); a method turned off by the planner settings of
+                     a statement (enable_hashjoin = off, ...) gets DISABLE_COST
+                     added like in PostgreSQL.
+    """
+
+    # Inserting a tuple into the hash table costs more than probing it
+    HASH_BUILD_FACTOR = 2.0
+    # Per pair of tuples compared by a nested loop over a materialized inner
+    NESTLOOP_FACTOR = 0.01
+    DISABLE_COST = 1.0e10
+    # join method -> (plan node type, setting that disables it)
+    JOIN_METHODS = {
+        "hash": ("Hash Join", "enable_hashjoin"),
+        "merge": ("Merge Join", "enable_mergejoin"),
+        "nestloop": ("Nested Loop", "enable_nestloop")
+    }
+
+    def __init__(self, sim_config):
+        self.model = sim_config.get('model', 'hash_join')
+        self.default_rows = sim_config.get('default_rows', 1000)
+        self.filter_selectivity = sim_config.get('filter_selectivity', 0.1)
+        self.stats_path = sim_config.get('stats_path')
+        self.ms_per_cost = sim_config.get('ms_per_cost', 0.001)
+        self.join_methods = sim_config.get('join_methods', ['hash'])
+        for method in self.join_methods:
+            if method not in self.JOIN_METHODS:
+                raise ValueError(f"Unknown simulated join method: {method}")
+
+        self.table_rows = {}
+        self.join_selectivities = {}
+        self._version = None
+        if self.stats_path:
+            self._load_stats(self.stats_path)
+
+        self.estimator = None
+        if sim_config.get('snapshot_path'):
+            self.estimator = CardinalityEstimator(sim_config['snapshot_path'])
+            self._version = self.estimator.version
+
+        self.parser = SQLParser()
+        self._queries = {} # sql -> (relations, edges)
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        sql = HINT_RE.sub('', query, count=1)
+        relations, edges = self._query_info(sql)
+        order = self._complete_order(join_order or [], relations, edges)
+        if not order:
+            raise ValueError("Query has no relations to cost")
+        plan = {"Plan": self._build_plan(order, relations, edges, settings)}
+        if analyze:
+            # Simulated runtime is proportional to cost; nothing is executed
+            execution_time = plan['Plan']['Total Cost'] * self.ms_per_cost
+            if timeout_ms and execution_time > timeout_ms:
+                raise StatementTimeout(f"canceling statement due to statement timeout ({timeout_ms} ms)")
+            plan['Execution Time'] = execution_time
+        return [plan]
+
+    def stats_version(self):
+        return self._version
+
+    def _load_stats(self, path):
+        with open(path, 'r') as f:
+            raw = f.read()
+        stats = json.loads(raw)
+        self.table_rows = stats.get('tables', {})
+        for predicate, selectivity in stats.get('joins', {}).items():
+            left, right = predicate.split('=')
+            self.join_selectivities[self._edge_key(left, right)] = selectivity
+        self._version = hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _edge_key(left, right):
+        return "=".join(sorted([left.strip(), right.strip()]))
+
+    def _query_info(self, sql):
+        """
+        Per-query relations (alias -> table, filtered rows) and join edges,
+        computed once per query text.
+        """
+        info = self._queries.get(sql)
+        if info is not None:
+            return info
+
+        parsed = self.parser.parse(sql)
+        aliases = parsed.get('aliases', {})
+
+        filters = local_filters(parsed)
+
+        relations = {}
+        for alias, table in aliases.items():
+            if self.estimator:
+                rows = self.estimator.estimate_table(table, filters.get(alias, []))
+            else:
+                rows = self._base_rows(table) * self.filter_selectivity ** len(filters.get(alias, []))
+            relations[alias] = {"table": table, "rows": float(rows)}
+
+        # edges[(a, b)] = product of the selectivities of all predicates between a and b
+        edges = {}
+        for predicate in parsed.get('joins', []):
+            parts = predicate.split('=')
+            if len(parts) != 2:
+                continue
+            left, right = COLUMN_RE.match(parts[0]), COLUMN_RE.match(parts[1])
+            if not left or not right:
+                continue
+            a, b = left.group(1), right.group(1)
+            if a not in relations or b not in relations or a == b:
+                continue
+            table_a, table_b = relations[a]['table'], relations[b]['table']
+            key = self._edge_key(f"{table_a}.{left.group(2)}", f"{table_b}.{right.group(2)}")
+            selectivity = self.join_selectivities.get(key)
+            if selectivity is None and self.estimator:
+                selectivity = self.estimator.join_selectivity(table_a, left.group(2), table_b, right.group(2))
+            if selectivity is None:
+                selectivity = 1.0 / max(self._base_rows(table_a), self._base_rows(table_b), 1)
+            for pair in ((a, b), (b, a)):
+                edges[pair] = edges.get(pair, 1.0) * selectivity
+
+        info = (relations, edges)
+        self._queries[sql] = info
+        return info
+
+    def _base_rows(self, table):
+        if self.estimator:
+            return self.estimator.table_rows(table, self.default_rows)
+        return float(self.table_rows.get(table, self.default_rows))
+
+    def _join_selectivity(self, joined, alias, edges):
+        selectivity = 1.0
+        for other in joined:
+            selectivity *= edges.get((other, alias), 1.0)
+        return selectivity
+
+    def _complete_order(self, join_order, relations, edges):
+        order = []
+        for alias in join_order:
+            if alias in relations and alias not in order:
+                order.append(alias)
+
+        remaining = [alias for alias in relations if alias not in order]
+        rows = self._prefix_rows(order, relations, edges)
+        while remaining:
+            # Prefer connected tables (no cross products), then the smallest result
+            def result_rows(alias):
+                if not order:
+                    return (False, relations[alias]['rows'])
+                connected = any((other, alias) in edges for other in order)
+                return (not connected, rows * relations[alias]['rows'] * self._join_selectivity(order, alias, edges))
+            best = min(remaining, key=result_rows)
+            rows = result_rows(best)[1]
+            order.append(best)
+            remaining.remove(best)
+        return order
+
+    def _prefix_rows(self, order, relations, edges):
+        if not order:
+            return 0.0
+        rows = relations[order[0]]['rows']
+        for i in range(1, len(order)):
+            rows *= relations[order[i]]['rows'] * self._join_selectivity(order[:i], order[i], edges)
+        return rows
+
+    def _scan_node(self, alias, relations):
+        relation = relations[alias]
+        cost = self._base_rows(relation['table']) if self.model == 'hash_join' else 0.0
+        return {
+            "Node Type": "Seq Scan",
+            "Relation Name": relation['table'],
+            "Alias": alias,
+            "Startup Cost": 0.0,
+            "Total Cost": cost,
+            "Plan Rows": max(relation['rows'], 1.0)
+        }
+
+    def _build_plan(self, order, relations, edges, settings=None):
+        node = self._scan_node(order[0], relations)
+        rows = node['Plan Rows']
+        cost = node['Total Cost']
+        for i in range(1, len(order)):
+            inner = self._scan_node(order[i], relations)
+            out_rows = max(rows * inner['Plan Rows'] * self._join_selectivity(order[:i], order[i], edges), 1.0)
+            if self.model == 'c_out':
+                method, join_cost = 'hash', out_rows
+            else:
+                method, join_cost = min(
+                    ((m, self._join_cost(m, rows, inner, out_rows, settings)) for m in self.join_methods),
+                    key=lambda candidate: candidate[1]
+                )
+            cost += join_cost
+            node = {
+                "Node Type": self.JOIN_METHODS[method][0],
+                "Join Type": "Inner",
+                "Startup Cost": 0.0,
+                "Total Cost": cost,
+                "Plan Rows": out_rows,
+                "Plans": self._join_children(method, node, inner)
+            }
+            rows = out_rows
+        return node
+
+    def _join_cost(self, method, outer_rows, inner, out_rows, settings):
+        inner_rows = inner['Plan Rows']
+        if method == 'hash':
+            cost = self.HASH_BUILD_FACTOR * inner_rows + outer_rows
+        elif method == 'merge':
+            cost = sum(n * math.log2(max(n, 2.0)) for n in (outer_rows, inner_rows))
+        else:
+            cost = self.NESTLOOP_FACTOR * outer_rows * inner_rows
+        cost += inner['Total Cost'] + out_rows
+        value = str((settings or {}).get(self.JOIN_METHODS[method][1], 'on')).lower()
+        if value in ('off', 'false', '0'):
+            cost += self.DISABLE_COST
+        return cost
+
+    @staticmethod
+    def _join_children(method, outer, inner):
+        if method == 'hash':
+            wrapped = [outer, {"Node Type": "Hash", "Total Cost": inner['Total Cost'],
+                               "Plan Rows": inner['Plan Rows'], "Plans": [inner]}]
+        elif method == 'merge':
+            wrapped = [{"Node Type": "Sort", "Total Cost": child['Total Cost'],
+                        "Plan Rows": child['Plan Rows'], "Plans": [child]} for child in (outer, inner)]
+        else:
+            wrapped = [outer, {"Node Type": "Materialize", "Total Cost": inner['Total Cost'],
+                               "Plan Rows": inner['Plan Rows'], "Plans": [inner]}]
+        return wrapped
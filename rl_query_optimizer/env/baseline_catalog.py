@@ -0,0 +1,135 @@
+import glob
+import json
+import os
+import threading
+from .sqlite_store import open_store
+
+# PostgreSQL's own defaults, overriding the session settings that pin the join order
+DEFAULT_PLANNER_SETTINGS = {
+    "join_collapse_limit": 8,
+    "from_collapse_limit": 8,
+    "enable_nestloop": "on"
+}
+
+class BaselineCatalog:
+    """
+    Stock PostgreSQL plan, cost and (optionally) latency per query, in a
+    SQLite file keyed by query fingerprint. Lookups are answered from memory
+    after the first read. An entry computed under other table statistics than
+    the current ones counts as missing, so it is recomputed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+
+        # Shared between env worker threads (serialized by self._lock) and processes
+        self._db = open_store(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS baselines ("
+            "fingerprint TEXT PRIMARY KEY, name TEXT, cost REAL, latency_ms REAL, "
+            "plan_fingerprint TEXT, plan TEXT, stats_version TEXT)"
+        )
+        self._db.commit()
+
+    def get(self, fingerprint, stats_version=None):
+        """
+        Baseline entry for a query fingerprint, or None if there is none or it
+        was computed under a different statistics version.
+        """
+        with self._lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT name, cost, latency_ms, plan_fingerprint, plan, stats_version "
+                    "FROM baselines WHERE fingerprint = ?", (fingerprint,)
+                ).fetchone()
+                if row is not None:
+                    entry = {
+                        "fingerprint": fingerprint,
+                        "name": row[0],
+                        "cost": row[1],
+                        "latency_ms": row[2],
+                        "plan_fingerprint": row[3],
+                        "plan": json.loads(row[4]) if row[4] else None,
+                        "stats_version": row[5]
+                    }
+                    self.entries[fingerprint] = entry
+        if entry is None:
+            return None
+        if stats_version is not None and entry['stats_version'] not in (None, stats_version):
+            return None
+        return entry
+
+    def put(self, entry):
+        with self._lock:
+            self.entries[entry['fingerprint']] = entry
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO baselines "
+                    "(fingerprint, name, cost, latency_ms, plan_fingerprint, plan, stats_version) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (entry['fingerprint'], entry.get('name'), entry.get('cost'), entry.get('latency_ms'),
+                     entry.get('plan_fingerprint'), json.dumps(entry.get('plan')), entry.get('stats_version'))
+                )
+                self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            if self._db is None:
+                return len(self.entries)
+            return self._db.execute("SELECT count(*) FROM baselines").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+def find_query_files(directories):
+    files = []
+    for directory in directories:
+        files.extend(sorted(glob.glob(os.path.join(directory, "*.sql"))))
+    return files
+
+def build_catalog(cost_interface, query_files, measure_latency=False, refresh=False):
+    """
+    Records the baseline of every query file through a CostInterface whose
+    cost.baselines.path names the catalog. Entries that are still valid for
+    the current statistics are skipped unless `refresh` is set.
+    returns:
+        number of baselines computed
+    """
+    computed_before = cost_interface.metrics.snapshot()['counters'].get('baselines_computed', 0)
+    for path in query_files:
+        with open(path, 'r') as f:
+            sql = f.read().strip()
+        if not sql:
+            continue
+        entry = cost_interface.baseline(sql, name=os.path.basename(path), measure_latency=measure_latency, refresh=refresh)
+        if entry is None:
+            print(f"No baseline for {path}")
+    return cost_interface.metrics.snapshot()['counters'].get('baselines_computed', 0) - computed_before
+
+if __name__ == "__main__":
+    import argparse
+    import yaml
+    from .cost_interface import CostInterface
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="rl_query_optimizer/config.yaml")
+    parser.add_argument("--queries", type=str, nargs="+", default=["queries", "rl_query_optimizer/data/train_queries"])
+    parser.add_argument("--latency", action="store_true", help="also measure the baseline with EXPLAIN ANALYZE")
+    parser.add_argument("--refresh", action="store_true", help="recompute entries that are still valid")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    cost_interface = CostInterface(config['database'], config.get('cost'))
+    if cost_interface.baselines is None:
+        raise SystemExit("Set cost.baselines.path in the config to build a catalog")
+    query_files = find_query_files(args.queries)
+    computed = build_catalog(cost_interface, query_files, measure_latency=args.latency, refresh=args.refresh)
+    print(f"Computed {computed} of {len(query_files)} baselines into {cost_interface.baselines.path}")
+    cost_interface.close()
@@ -0,0 +1,133 @@
+import threading
+import numpy as np
+
+NODE_TYPES = [
+    "Seq Scan", "Index Scan", "Index Only Scan", "Bitmap Heap Scan",
+    "Hash Join", "Merge Join", "Nested Loop",
+    "Hash", "Sort", "Materialize", "Aggregate", "Gather"
+]
+
+GLOBAL_FAMILY = "*"
+
+def plan_features(parsed_plan):
+    """
+    Feature vector of a parsed EXPLAIN plan (PlanParser.parse_explain_json):
+    bias, log total/startup cost, log root rows, log total rows over all
+    nodes, and a count per node type.
+    """
+    counts = np.zeros(len(NODE_TYPES))
+    total_rows = 0.0
+    stack = [parsed_plan['plan_tree']]
+    while stack:
+        node = stack.pop()
+        if node.get('node_type') in NODE_TYPES:
+            counts[NODE_TYPES.index(node['node_type'])] += 1
+        total_rows += node.get('rows') or 0.0
+        stack.extend(node.get('children', []))
+
+    root_rows = parsed_plan['plan_tree'].get('rows') or 0.0
+    return np.concatenate([
+        [1.0,
+         np.log1p(parsed_plan['total_cost'] or 0.0),
+         np.log1p(parsed_plan['startup_cost'] or 0.0),
+         np.log1p(root_rows),
+         np.log1p(total_rows)],
+        counts
+    ])
+
+class _FamilyModel:
+    """
+    Ridge regression on log latency, refit incrementally from accumulated
+    sufficient statistics. `decay` < 1 slowly forgets old samples so the
+    model follows a drifting server.
+    """
+
+    def __init__(self, dim, ridge, decay):
+        self.ridge = ridge
+        self.decay = decay
+        self.xtx = np.zeros((dim, dim))
+        self.xty = np.zeros(dim)
+        self.samples = 0
+        self._weights = None
+
+    def update(self, x, y):
+        self.xtx = self.decay * self.xtx + np.outer(x, x)
+        self.xty = self.decay * self.xty + x * y
+        self.samples += 1
+        self._weights = None
+
+    def predict(self, x):
+        if self._weights is None:
+            self._weights = np.linalg.solve(self.xtx + self.ridge * np.eye(len(x)), self.xty)
+        return float(x @ self._weights)
+
+class LatencyCalibrator:
+    """
+    Maps cheap EXPLAIN plans to predicted milliseconds, with one model per
+    query family (the set of tables a query touches) and a global model that
+    covers families with too few samples.
+
+    Before every update the current prediction is scored against the measured
+    latency. The mean absolute log error per window of `drift_window` samples
+    shows whether the calibration is drifting.
+    """
+
+    def __init__(self, min_samples=20, ridge=1.0, decay=0.999, drift_window=200):
+        self.min_samples = min_samples
+        self.ridge = ridge
+        self.decay = decay
+        self.drift_window = drift_window
+
+        self.models = {}
+        self.drift = [] # mean |log(pred) - log(actual)| per completed window
+        self._window_errors = []
+        self._lock = threading.Lock()
+
+    def ready(self, family):
+        with self._lock:
+            return self._model_for(family) is not None
+
+    def predict(self, family, parsed_plan):
+        """
+        Predicted latency in ms, or None while no model has enough samples.
+        """
+        with self._lock:
+            model = self._model_for(family)
+            if model is None:
+                return None
+            return float(np.expm1(max(model.predict(plan_features(parsed_plan)), 0.0)))
+
+    def update(self, family, parsed_plan, latency_ms):
+        x = plan_features(parsed_plan)
+        y = np.log1p(latency_ms)
+        with self._lock:
+            model = self._model_for(family)
+            if model is not None:
+                self._record_error(abs(model.predict(x) - y))
+            for key in (family, GLOBAL_FAMILY):
+                if key not in self.models:
+                    self.models[key] = _FamilyModel(len(x), self.ridge, self.decay)
+                self.models[key].update(x, y)
+
+    def drift_report(self):
+        with self._lock:
+            current = float(np.mean(self._window_errors)) if self._window_errors else None
+            return {
+                "families": len(self.models) - (1 if GLOBAL_FAMILY in self.models else 0),
+                "samples": self.models[GLOBAL_FAMILY].samples if GLOBAL_FAMILY in self.models else 0,
+                "window_mean_abs_log_error": list(self.drift),
+                "current_window_error": current
+            }
+
+    def _model_for(self, family):
+        for key in (family, GLOBAL_FAMILY):
+            model = self.models.get(key)
+            if model is not None and model.samples >= self.min_samples:
+                return model
+        return None
+
+    def _record_error(self, error):
+        self._window_errors.append(error)
+        if len(self._window_errors) >= self.drift_window:
+            self.drift.append(float(np.mean(self._window_errors)))
+            self._window_errors = []
@@ -0,0 +1,125 @@
+import threading
+from .sqlite_store import open_store
+
+JOIN_NODE_TYPES = ("Hash Join", "Merge Join", "Nested Loop")
+
+def join_cardinalities(plan_tree):
+    """
+    (aliases, estimated rows, actual rows) for every join node of a parsed
+    EXPLAIN ANALYZE plan (PlanParser.parse_explain_json). Rows are totals over
+    all loops of the node. Joins without actual rows (not analyzed, never
+    executed) are skipped.
+    """
+    found = []
+
+    def visit(node):
+        aliases = set()
+        if node.get('alias'):
+            aliases.add(node['alias'])
+        for child in node.get('children', []):
+            aliases |= visit(child)
+        if node.get('node_type') in JOIN_NODE_TYPES and len(aliases) > 1 and node.get('actual_rows') is not None:
+            loops = node.get('loops') or 1
+            found.append((sorted(aliases), (node.get('rows') or 0.0) * loops, node['actual_rows'] * loops))
+        return aliases
+
+    visit(plan_tree)
+    return found
+
+def q_error(estimated, actual):
+    estimated = max(estimated, 1.0)
+    actual = max(actual, 1.0)
+    return max(estimated / actual, actual / estimated)
+
+class CardinalityFeedback:
+    """
+    Learns join cardinalities from EXPLAIN ANALYZE runs and turns badly
+    misestimated ones into pg_hint_plan Rows(...) hints.
+
+    For every join subset of a query the last observed actual row count is
+    kept, together with the q-error of the planner's estimate. Subsets whose
+    q-error reaches `min_q_error` get a Rows(a b #actual) hint, so later
+    EXPLAINs of the query plan with the corrected cardinality. Corrections
+    are kept in a SQLite file when `path` is given.
+    """
+
+    def __init__(self, path=None, min_q_error=4.0):
+        self.path = path
+        self.min_q_error = min_q_error
+        self.corrections = {} # query fingerprint -> {"a b": (actual rows, q-error)}
+        self._hints = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._open_store(path)
+
+    def record(self, fingerprint, parsed_plan):
+        """
+        Stores the actual join cardinalities of an analyzed plan.
+        returns:
+            number of subsets whose Rows hint changed
+        """
+        changed = 0
+        with self._lock:
+            corrections = self.corrections.setdefault(fingerprint, {})
+            for aliases, estimated, actual in join_cardinalities(parsed_plan['plan_tree']):
+                key = " ".join(aliases)
+                error = q_error(estimated, actual)
+                previous = corrections.get(key)
+                # The estimate made under an existing Rows hint is the hinted
+                # value, so only a fresh estimate can lower the stored q-error
+                if previous is not None and previous[0] == round(actual):
+                    continue
+                corrections[key] = (round(actual), max(error, previous[1]) if previous else error)
+                if self._db is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO corrections (query, relations, actual_rows, q_error) VALUES (?, ?, ?, ?)",
+                        (fingerprint, key, corrections[key][0], corrections[key][1])
+                    )
+                if corrections[key][1] >= self.min_q_error:
+                    changed += 1
+            if changed:
+                self._hints.pop(fingerprint, None)
+            if self._db is not None:
+                self._db.commit()
+        return changed
+
+    def rows_hints(self, fingerprint):
+        """
+        Rows(...) hints for the query, e.g. "Rows(mi t #5213) Rows(k mk t #87)",
+        or "" when none of its subsets is misestimated enough.
+        """
+        with self._lock:
+            hints = self._hints.get(fingerprint)
+            if hints is None:
+                hints = " ".join(
+                    f"Rows({key} #{actual})"
+                    for key, (actual, error) in sorted(self.corrections.get(fingerprint, {}).items())
+                    if error >= self.min_q_error
+                )
+                self._hints[fingerprint] = hints
+            return hints
+
+    def stats(self):
+        with self._lock:
+            subsets = sum(len(c) for c in self.corrections.values())
+            hinted = sum(1 for c in self.corrections.values() for _, error in c.values() if error >= self.min_q_error)
+            return {"queries": len(self.corrections), "subsets": subsets, "hinted_subsets": hinted}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def _open_store(self, path):
+        # Shared between env worker threads (serialized by self._lock) and processes
+        self._db = open_store(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS corrections ("
+            "query TEXT, relations TEXT, actual_rows REAL, q_error REAL, PRIMARY KEY (query, relations))"
+        )
+        self._db.commit()
+        for query, relations, actual, error in self._db.execute("SELECT query, relations, actual_rows, q_error FROM corrections"):
+            self.corrections.setdefault(query, {})[relations] = (int(actual), error)
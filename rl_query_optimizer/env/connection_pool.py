@@ -0,0 +1,331 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL sessions for the cost layer.
+
+    Every connection gets the same session GUCs (join_collapse_limit and the
+    configured planner settings) when it is opened, so a connection that is
+    replaced after a failure behaves exactly like the one it replaces.
+    """
+
+    def __init__(self, db_config, min_size=1, max_size=8, health_check_interval=30.0, acquire_timeout=30.0):
+        self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self.session_settings = {
+            'join_collapse_limit': db_config.get('join_collapse_limit', 1),
+            'enable_nestloop': 'off'
+        }
+        self.session_settings.update(db_config.get('session_settings') or {})
+
+        self._idle = deque() # (conn, last_used)
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self.reconnects = 0
+        for _ in range(self.min_size):
+            self._idle.append((self._open(), time.time()))
+            self._size += 1
+
+    @contextmanager
+    def lease(self, check=False):
+        """
+        Borrow a connection for the duration of a with-block. A connection
+        found dead when it comes back is dropped instead of being reused.
+        check=True health-checks the connection even if it was used recently.
+        """
+        conn = self._acquire(check)
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "reconnects": self.reconnects
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                conn.close()
+            self._cond.notify_all()
+
+    def _acquire(self, check=False):
+        deadline = time.time() + self.acquire_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reserve the slot before connecting outside the lock
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No connection available after {self.acquire_timeout}s")
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                return self._open()
+            if check or conn.closed or time.time() - last_used > self.health_check_interval:
+                return self._check(conn)
+            return conn
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn):
+        with self._cond:
+            if conn.closed or self._closed:
+                self._size -= 1
+                if not conn.closed:
+                    conn.close()
+            else:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    def _check(self, conn):
+        """
+        Returns a healthy connection: the given one if it still answers,
+        otherwise a fresh session with the GUCs re-applied.
+        """
+        if not conn.closed:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                return conn
+            except psycopg2.Error:
+                conn.close()
+        with self._cond:
+            self.reconnects += 1
+        return self._open()
+
+    def _open(self):
+        conn = psycopg2.connect(
+            dbname=self.db_config['dbname'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            host=self.db_config['host'],
+            port=self.db_config['port']
+        )
+        conn.autocommit = True
+        # Enforce join order optimization by disabling reordering
+        with conn.cursor() as cur:
+            for name, value in self.session_settings.items():
+                cur.execute(f"SET {name} = %s;", (str(value),))
+        return conn
+
+class _Replica:
+    def __init__(self, name, db_config):
+        self.name = name
+        self.db_config = db_config
+        self.pool = None
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.mismatched = False # schema or statistics differ from the reference
+
+class ReplicaSet:
+    """
+    Spreads leases over several PostgreSQL endpoints that serve the same
+    database, each with its own ConnectionPool. Every lease goes to the
+    replica with the fewest outstanding leases. A replica that fails to
+    connect or drops a session is ejected for `eject_seconds`, then
+    reconnected and verified again on its next lease.
+
+    verify() runs fingerprint queries (schema, statistics) on every replica
+    and permanently excludes the ones that disagree with the first replica
+    that answered, since their costs would not be comparable.
+    """
+
+    def __init__(self, db_config, replicas, pool_kwargs=None, eject_seconds=60.0):
+        self.pool_kwargs = pool_kwargs or {}
+        self.eject_seconds = eject_seconds
+        self._reference = None # (queries, results) every replica has to match
+        self._lock = threading.Lock()
+
+        base = {k: v for k, v in db_config.items() if k != 'replicas'}
+        self.replicas = []
+        for endpoint in replicas:
+            config = dict(base)
+            config.update(endpoint)
+            self.replicas.append(_Replica(f"{config['host']}:{config['port']}/{config['dbname']}", config))
+
+        for replica in self.replicas:
+            self._open(replica)
+        if not any(replica.pool for replica in self.replicas):
+            raise psycopg2.OperationalError("No database replica is reachable")
+
+    @contextmanager
+    def lease(self, check=False):
+        replica, pool, conn = self._acquire(check)
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            if conn.closed:
+                self._eject(replica, "session lost")
+            raise
+        finally:
+            pool._release(conn)
+            with self._lock:
+                replica.outstanding -= 1
+
+    def verify(self, queries):
+        """
+        Runs each single-value query on every replica and excludes replicas
+        whose answers differ from the first replica that answered.
+        """
+        with self._lock:
+            self._reference = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                self._check_fingerprints(replica, queries)
+        if not any(replica.pool for replica in self.replicas):
+            raise psycopg2.OperationalError("No database replica passed verification")
+
+    def execute_all(self, sql):
+        """
+        Runs a statement once on every available replica, e.g. to install a
+        helper function in each database.
+        """
+        for replica in self.replicas:
+            pool = replica.pool
+            if pool is None:
+                continue
+            with pool.lease() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "replicas": [{
+                    "name": r.name,
+                    "outstanding": r.outstanding,
+                    "served": r.served,
+                    "failures": r.failures,
+                    "ejected": r.pool is None,
+                    "mismatched": r.mismatched,
+                    "pool": r.pool.stats() if r.pool else None
+                } for r in self.replicas]
+            }
+
+    def close(self):
+        for replica in self.replicas:
+            with self._lock:
+                pool, replica.pool = replica.pool, None
+            if pool is not None:
+                pool.close()
+
+    def _acquire(self, check):
+        tried = set()
+        while True:
+            with self._lock:
+                now = time.time()
+                candidates = [
+                    r for r in self.replicas
+                    if r.name not in tried and not r.mismatched and (r.pool is not None or r.ejected_until <= now)
+                ]
+                if not candidates:
+                    raise psycopg2.OperationalError("All database replicas are unavailable")
+                replica = min(candidates, key=lambda r: (r.outstanding, r.served))
+                replica.outstanding += 1
+                replica.served += 1
+            tried.add(replica.name)
+
+            try:
+                pool = replica.pool
+                if pool is None and self._open(replica) and self._check_fingerprints(replica, None):
+                    pool = replica.pool
+                if pool is not None:
+                    return replica, pool, pool._acquire(check)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self._eject(replica, e)
+            except Exception:
+                with self._lock:
+                    replica.outstanding -= 1
+                raise
+            with self._lock:
+                replica.outstanding -= 1
+
+    def _open(self, replica):
+        try:
+            pool = ConnectionPool(replica.db_config, **self.pool_kwargs)
+        except psycopg2.Error as e:
+            self._eject(replica, e)
+            return False
+        with self._lock:
+            replica.pool = pool
+        return True
+
+    def _check_fingerprints(self, replica, queries):
+        """
+        Compares the replica's fingerprints with the reference. The first
+        replica checked with new `queries` establishes the reference; without
+        queries the current reference is re-checked (after a reconnect).
+        """
+        with self._lock:
+            reference = self._reference
+        if queries is None:
+            if reference is None:
+                return True
+            queries = reference[0]
+        try:
+            with replica.pool.lease() as conn:
+                with conn.cursor() as cur:
+                    results = []
+                    for sql in queries:
+                        cur.execute(sql)
+                        results.append(cur.fetchone()[0])
+        except psycopg2.Error as e:
+            self._eject(replica, e)
+            return False
+
+        with self._lock:
+            if self._reference is None or self._reference[0] != queries:
+                self._reference = (queries, results)
+                return True
+            matches = self._reference[1] == results
+        if not matches:
+            print(f"Replica {replica.name} has a different schema or statistics fingerprint, excluding it")
+            replica.mismatched = True
+            self._eject(replica, "fingerprint mismatch")
+        return matches
+
+    def _eject(self, replica, reason):
+        with self._lock:
+            replica.failures += 1
+            replica.ejected_until = time.time() + self.eject_seconds
+            pool, replica.pool = replica.pool, None
+        print(f"Ejecting database replica {replica.name} for {self.eject_seconds}s: {reason}")
+        if pool is not None:
+            pool.close()
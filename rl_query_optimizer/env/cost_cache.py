@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict
+from .sqlite_store import open_store
+
+class CostCache:
+    """
+    Memoizes estimate_cost results keyed by (query fingerprint, join order).
+
+    Entries live in a bounded in-memory LRU. When a path is given they are
+    also written to a small SQLite file so later runs start warm. All entries
+    are tagged with the database statistics version they were computed under;
+    a new version drops everything.
+    """
+
+    def __init__(self, max_entries=100000, path=None, commit_every=256):
+        self.max_entries = max_entries
+        self.path = path
+        self.commit_every = commit_every
+        self.entries = OrderedDict()
+        self.stats_version = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._db = None
+        self._pending = {} # key -> cost not yet in the file
+        if path:
+            self._open_store(path)
+
+    @staticmethod
+    def make_key(fingerprint, join_order):
+        """
+        Join order is kept as given: Leading(a b c) and Leading(b a c)
+        are different plans.
+        """
+        return f"{fingerprint}:{' '.join(t.strip() for t in join_order)}"
+
+    def get(self, key):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT cost FROM costs WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._insert(key, row[0])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, cost):
+        with self._lock:
+            self._insert(key, cost)
+            if self._db is not None:
+                # Written in batches, each in one short transaction, so other
+                # processes sharing the file never wait on an open write
+                self._pending[key] = cost
+                if len(self._pending) >= self.commit_every:
+                    self._flush()
+
+    def set_stats_version(self, version):
+        """
+        Record the statistics version of the database. If it differs from the
+        version the cached entries were computed under, they are discarded.
+        """
+        with self._lock:
+            if version == self.stats_version:
+                return
+            if self.stats_version is not None or self._stored_version() not in (None, version):
+                self._clear()
+            self.stats_version = version
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('stats_version', ?)", (version,))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "size": len(self.entries)
+        }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._flush()
+                self._db.close()
+                self._db = None
+
+    def _insert(self, key, cost):
+        self.entries[key] = cost
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _clear(self):
+        self.entries.clear()
+        self._pending.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM costs")
+            self._db.commit()
+
+    def _flush(self):
+        if self._pending:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO costs (key, cost) VALUES (?, ?)", list(self._pending.items()))
+            self._pending.clear()
+
+    def _stored_version(self):
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'stats_version'").fetchone()
+        return row[0] if row else None
+
+    def _open_store(self, path):
+        # Shared between env worker threads (serialized by self._lock) and processes
+        self._db = open_store(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS costs (key TEXT PRIMARY KEY, cost REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
@@ -1,33 +1,220 @@
-import psycopg2
+import asyncio
+import hashlib
 import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from ..utils.plan_parser import PlanParser
+from ..utils.sql_parser import SQLParser, build_prefix_query, query_fingerprint
+from ..utils.metrics import Metrics
+from .cost_cache import CostCache
+from .baseline_catalog import BaselineCatalog, DEFAULT_PLANNER_SETTINGS
+from .cardinality_feedback import CardinalityFeedback
+from .calibration import LatencyCalibrator
+from .measurement_scheduler import MeasurementScheduler
+from .backends.base import StatementTimeout
+from .backends.cassette import CassetteMiss
+
+# Planner-knob arms: name -> settings applied with SET LOCAL for one statement
+DEFAULT_ARMS = {
+    "default": {},
+    "no_hashjoin": {"enable_hashjoin": "off"},
+    "no_mergejoin": {"enable_mergejoin": "off"},
+    "nestloop": {"enable_nestloop": "on"},
+    "no_indexscan": {"enable_indexscan": "off"},
+    "hashjoin_only": {"enable_mergejoin": "off", "enable_nestloop": "off"}
+}
 
 class CostInterface:
-    def __init__(self, db_config):
+    FAILURE_PENALTY = 100000.0
+
+    def __init__(self, db_config, cost_config=None):
         self.db_config = db_config
-        self.conn = None
+        self.cost_config = cost_config or {}
         self.parser = PlanParser()
+        self.metrics = Metrics()
+        self._connected = False
+        self._connect_lock = threading.Lock()
+
+        cache_config = self.cost_config.get('cache', {})
+        self.cache = None
+        if cache_config.get('enabled', False):
+            self.cache = CostCache(
+                max_entries=cache_config.get('max_entries', 100000),
+                path=cache_config.get('path')
+            )
+        self.stats_check_interval = cache_config.get('stats_check_interval', 300)
+        self._last_stats_check = 0.0
+        self.stats_version = None
+
+        baseline_config = self.cost_config.get('baselines', {})
+        self.baselines = BaselineCatalog(baseline_config['path']) if baseline_config.get('path') else None
+        self.baseline_settings = baseline_config.get('settings') or DEFAULT_PLANNER_SETTINGS
+        self._fingerprints = {}
+        self._parsed_queries = {}
+
+        # Cost a partial join order with a query over just the joined relations
+        self.prefix_queries = self.cost_config.get('prefix_queries', False)
+        self._prefix_query_cache = {}
+
+        batch_config = self.cost_config.get('batch', {})
+        self.batch_concurrency = batch_config.get('concurrency', 8)
+        self.batch_timeout = batch_config.get('timeout')
+        self._executor = None
+        self._executor_size = 0
+        self._executor_lock = threading.Lock()
+        # executor -> aestimate_costs calls using it; a replaced executor is
+        # shut down once its count drops to zero
+        self._executor_users = {}
+        # Worker threads whose call a batch timeout cancelled; the timeout
+        # already counted the penalty for it
+        self._cancelled_threads = set()
+
+        self.reward_mode = self.cost_config.get('reward_mode', 'cost')
+        latency_config = self.cost_config.get('latency', {})
+        self.timeout_factor = latency_config.get('timeout_factor', 2.0)
+        self.min_timeout_ms = latency_config.get('min_timeout_ms', 100)
+        self.max_timeout_ms = latency_config.get('max_timeout_ms', 60000)
+        self.censor_factor = latency_config.get('censor_factor', 2.0)
+        self.best_latency = {} # query fingerprint -> fastest observed ms
+        self._latency_lock = threading.Lock()
+        # Reuse a measured latency for every join order that yields the same
+        # physical plan (kept in the cost cache if enabled, else in memory)
+        self.plan_reuse = self.cost_config.get('plan_reuse', True)
+        self._plan_latencies = {}
+
+        # Actual join cardinalities from ANALYZE runs, fed back as Rows hints
+        feedback_config = self.cost_config.get('feedback', {})
+        self.feedback = None
+        if feedback_config.get('enabled', False):
+            self.feedback = CardinalityFeedback(
+                path=feedback_config.get('path'),
+                min_q_error=feedback_config.get('min_q_error', 4.0)
+            )
+
+        calibration_config = self.cost_config.get('calibration', {})
+        self.calibration_sample_rate = calibration_config.get('sample_rate', 0.05)
+        self.calibrator = LatencyCalibrator(
+            min_samples=calibration_config.get('min_samples', 20),
+            ridge=calibration_config.get('ridge', 1.0),
+            decay=calibration_config.get('decay', 0.999),
+            drift_window=calibration_config.get('drift_window', 200)
+        )
+        self._rng = random.Random(calibration_config.get('seed'))
+        self._families = {}
+
+        self.arms = self.cost_config.get('arms') or DEFAULT_ARMS
+
+        self.raise_on_miss = self.cost_config.get('cassette', {}).get('strict', False)
+        self.backend = self._create_backend(self.cost_config.get('backend', 'postgres'))
+
+        # ANALYZE runs get their own, lower concurrency limit than EXPLAIN
+        measurement_config = self.cost_config.get('measurement', {})
+        self.scheduler = MeasurementScheduler(
+            max_concurrent=measurement_config.get('max_concurrent', 1),
+            acquire_slot=self.backend.measurement_slot,
+            sample_load=measurement_config.get('sample_load', True),
+            max_active_backends=measurement_config.get('max_active_backends', 2),
+            min_buffer_hit_ratio=measurement_config.get('min_buffer_hit_ratio'),
+            max_remeasure=measurement_config.get('max_remeasure', 2),
+            metrics=self.metrics
+        )
+
+    def _create_backend(self, name):
+        """
+        Backends are imported lazily so the simulated and cassette backends
+        work without psycopg2.
+        """
+        if name == 'postgres':
+            from .backends.postgres import PostgresBackend
+            server_batch = self.cost_config.get('batch', {}).get('server_side', False)
+            return PostgresBackend(self.db_config, server_batch=server_batch)
+        if name == 'simulated':
+            from .backends.simulated import SimulatedBackend
+            return SimulatedBackend(self.cost_config.get('simulated', {}))
+        if name == 'cassette':
+            from .backends.cassette import CassetteBackend
+            cassette_config = self.cost_config.get('cassette', {})
+            mode = cassette_config.get('mode', 'replay')
+            inner = self._create_backend(cassette_config.get('inner', 'postgres')) if mode == 'record' else None
+            return CassetteBackend(cassette_config['path'], mode=mode, inner=inner)
+        raise ValueError(f"Unknown cost backend: {name}")
 
     def connect(self):
+        """
+        Connects the backend. Failures propagate to the caller;
+        estimate_cost turns them into the failure penalty.
+        """
+        with self._connect_lock:
+            if self._connected:
+                return
+            with self.metrics.timer('connect'):
+                self.backend.connect()
+            self._connected = True
+        self.refresh_stats_version()
+
+    def close(self):
+        with self._executor_lock:
+            executors = list(self._executor_users)
+            if self._executor is not None and self._executor not in self._executor_users:
+                executors.append(self._executor)
+            self._executor = None
+            self._executor_size = 0
+            self._executor_users = {}
+        for executor in executors:
+            executor.shutdown(wait=True)
+        self.backend.close()
+        self._connected = False
+        if self.cache:
+            self.cache.close()
+        if self.baselines is not None:
+            self.baselines.close()
+        if self.feedback is not None:
+            self.feedback.close()
+
+    def refresh_stats_version(self):
+        """
+        Reads the current statistics version from the database and hands it
+        to the cache, which drops its entries if the statistics changed.
+        """
+        self._last_stats_check = time.time()
+        if (self.cache is None and self.baselines is None) or not self._connected:
+            return
         try:
-            self.conn = psycopg2.connect(
-                dbname=self.db_config['dbname'],
-                user=self.db_config['user'],
-                password=self.db_config['password'],
-                host=self.db_config['host'],
-                port=self.db_config['port']
-            )
-            self.conn.autocommit = True
-            # Enforce join order optimization by disabling reordering
-            with self.conn.cursor() as cur:
-                cur.execute(f"SET join_collapse_limit = {self.db_config.get('join_collapse_limit', 1)};")
-                cur.execute("SET enable_nestloop = off;") # Optional: heuristics
+            version = self.backend.stats_version()
+            self.stats_version = version
+            if version is not None and self.cache:
+                self.cache.set_stats_version(version)
         except Exception as e:
-            print(f"Failed to connect to DB: {e}")
+            print(f"Failed to read statistics version: {e}")
 
-    def close(self):
-        if self.conn:
-            self.conn.close()
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else {}
+
+    def metrics_snapshot(self):
+        """
+        Counters and latency histograms (connect, hint, explain, analyze,
+        parse) collected so far, together with cache, measurement and backend
+        statistics.
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot['cache'] = self.cache_stats()
+        snapshot['measurements'] = self.scheduler.stats()
+        if self.feedback is not None:
+            snapshot['feedback'] = self.feedback.stats()
+        if hasattr(self.backend, 'stats'):
+            snapshot['backend'] = self.backend.stats()
+        return snapshot
+
+    def export_metrics(self, path):
+        snapshot = self.metrics_snapshot()
+        return self.metrics.export(path, extra={
+            "cache": snapshot['cache'],
+            "measurements": snapshot['measurements'],
+            "feedback": snapshot.get('feedback', {}),
+            "backend": snapshot.get('backend', {})
+        })
 
     def estimate_cost(self, join_order, sql_query_template):
         """
@@ -35,40 +222,595 @@ class CostInterface:
         args:
             join_order: list of tables in order e.g. ['t1', 't2', 't3']
             sql_query_template: the original query string
+        returns:
+            optimizer Total Cost, or milliseconds in latency/calibrated reward mode
         """
-        if not self.conn:
-            self.connect()
+        self.metrics.incr('calls')
+        sql_query_template = self._costed_query(join_order, sql_query_template)
+        cache_key = None
+        if self.cache:
+            self._maybe_refresh_stats()
+            cache_key = self._cache_key(join_order, sql_query_template)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.metrics.incr('cache_hits')
+                return cached
+            self.metrics.incr('cache_misses')
+
+        with self.metrics.timer('hint'):
+            hint = self._generate_leading_hint(join_order, sql_query_template)
+            final_query = f"{hint}\n{sql_query_template}"
 
-        hint = self._generate_leading_hint(join_order)
-        final_query = f"{hint}\n{sql_query_template}"
-        
-        # We use EXPLAIN (FORMAT JSON) to get cost without executing
-        # This is much faster than ANALYZE which actually runs the query.
-        explain_cmd = f"EXPLAIN (FORMAT JSON) {final_query}"
-        
         try:
-            with self.conn.cursor() as cur:
-                import time
-                start_t = time.time()
-                print(f"DEBUG: Estimating cost for join_order={join_order}...")
-                cur.execute(explain_cmd)
-                print(f"DEBUG: EXPLAIN finished in {time.time() - start_t:.4f}s")
-                result = cur.fetchone()[0] # JSON output
-                
-            parsed = self.parser.parse_explain_json(result)
-            # Use estimated total_cost instead of actual execution_time
-            return parsed['total_cost'] if parsed['total_cost'] else 100000.0
+            if not self._connected:
+                self.connect()
+            if self.reward_mode == 'latency':
+                value, cacheable = self._measure_latency(final_query, join_order, sql_query_template)
+            elif self.reward_mode == 'calibrated':
+                value, cacheable = self._calibrated_latency(final_query, join_order, sql_query_template)
+            else:
+                value, cacheable = self._explain_cost(final_query, join_order)
+        except CassetteMiss as e:
+            self.metrics.incr('cassette_misses')
+            if self.raise_on_miss:
+                raise
+            print(f"Query execution failed: {e}")
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY
         except Exception as e:
+            if threading.get_ident() in self._cancelled_threads:
+                return self.FAILURE_PENALTY
             print(f"Query execution failed: {e}")
-            return 100000.0 # High penalty for failure
+            self.metrics.incr('failures')
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY # High penalty for failure
+
+        if cacheable and cache_key is not None:
+            self.cache.put(cache_key, value)
+        return value
+
+    def _maybe_refresh_stats(self):
+        if time.time() - self._last_stats_check > self.stats_check_interval:
+            self.refresh_stats_version()
+
+    def baseline(self, sql_query_template, name=None, measure_latency=False, refresh=False):
+        """
+        Plan, cost and optionally latency of the query under the stock planner
+        (cost.baselines.settings restore PostgreSQL's join_collapse_limit etc.,
+        no Leading hint). Served from the baseline catalog when it holds an
+        entry for the current statistics, otherwise computed and stored.
+        returns:
+            {"fingerprint", "name", "cost", "latency_ms", "plan_fingerprint",
+             "plan", "stats_version"}, or None if the query could not be planned
+        """
+        fingerprint = self._fingerprint(sql_query_template)
+        try:
+            if not self._connected:
+                self.connect()
+            self._maybe_refresh_stats()
+        except Exception as e:
+            print(f"Query execution failed: {e}")
+            return self.baselines.get(fingerprint) if self.baselines is not None else None
+
+        if self.baselines is not None and not refresh:
+            entry = self.baselines.get(fingerprint, self.stats_version)
+            if entry is not None and (entry['latency_ms'] is not None or not measure_latency):
+                self.metrics.incr('baseline_hits')
+                return entry
+
+        try:
+            with self.metrics.timer('baseline'):
+                result = self.backend.explain(sql_query_template, settings=self.baseline_settings)
+                parsed = self.parser.parse_explain_json(result)
+                latency = None
+                if measure_latency:
+                    try:
+                        analyzed, _ = self.scheduler.measure(
+                            lambda session: session.explain(sql_query_template, analyze=True, timeout_ms=self.max_timeout_ms,
+                                                            settings=self.baseline_settings),
+                            tag={"query": fingerprint, "baseline": True}
+                        )
+                        latency = self.parser.parse_explain_json(analyzed)['execution_time']
+                    except StatementTimeout:
+                        self.metrics.incr('timeouts')
+        except Exception as e:
+            print(f"Baseline failed: {e}")
+            self.metrics.incr('failures')
+            return None
+
+        entry = {
+            "fingerprint": fingerprint,
+            "name": name,
+            "cost": parsed['total_cost'],
+            "latency_ms": latency,
+            "plan_fingerprint": parsed['plan_fingerprint'],
+            "plan": result if not isinstance(result, str) else json.loads(result),
+            "stats_version": self.stats_version
+        }
+        self.metrics.incr('baselines_computed')
+        if self.baselines is not None:
+            self.baselines.put(entry)
+        return entry
+
+    def _explain_cost(self, final_query, join_order):
+        parsed = self._explain_plan(final_query, join_order)
+        # Use estimated total_cost instead of actual execution_time
+        if not parsed['total_cost']:
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY, False
+        return parsed['total_cost'], True
+
+    def _explain_plan(self, final_query, join_order):
+        with self.metrics.timer('explain'):
+            result = self.backend.explain(final_query, join_order) # JSON output
+        with self.metrics.timer('parse'):
+            return self.parser.parse_explain_json(result)
+
+    def _measure_latency(self, final_query, join_order, sql_query_template, parsed=None):
+        """
+        Runs EXPLAIN ANALYZE under a statement timeout derived from the best
+        latency seen for this query. A run that hits the timeout is not waited
+        for; it gets a censored penalty proportional to the timeout instead.
+        With plan reuse, a plain EXPLAIN first identifies the physical plan and
+        a latency already measured for that plan is returned without running it.
+        """
+        fingerprint = self._fingerprint(sql_query_template)
+        if self.plan_reuse:
+            if parsed is None:
+                parsed = self._explain_plan(final_query, join_order)
+            reused = self._plan_latency(fingerprint, parsed)
+            if reused is not None:
+                return reused, True
+        timeout_ms = self._latency_timeout(fingerprint)
+        try:
+            with self.metrics.timer('analyze'):
+                result, measurement = self.scheduler.measure(
+                    lambda session: session.explain(final_query, join_order, analyze=True, timeout_ms=timeout_ms),
+                    tag={"query": fingerprint, "join_order": list(join_order)}
+                )
+        except StatementTimeout:
+            self.metrics.incr('timeouts')
+            self.metrics.incr('censored')
+            return timeout_ms * self.censor_factor, False
+
+        with self.metrics.timer('parse'):
+            analyzed = self.parser.parse_explain_json(result)
+        latency = analyzed['execution_time']
+        if latency is None:
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY, False
+        if latency > timeout_ms:
+            # Replayed or simulated runs are not interrupted by the server
+            self.metrics.incr('censored')
+            return timeout_ms * self.censor_factor, False
+
+        measurement['latency_ms'] = latency
+        if self.feedback is not None:
+            corrected = self.feedback.record(fingerprint, analyzed)
+            if corrected:
+                self.metrics.incr('cardinality_corrections', corrected)
+        if self.plan_reuse:
+            self._store_plan_latency(fingerprint, analyzed, latency)
+        with self._latency_lock:
+            best = self.best_latency.get(fingerprint)
+            if best is None or latency < best:
+                self.best_latency[fingerprint] = latency
+        return latency, True
+
+    def _calibrated_latency(self, final_query, join_order, sql_query_template):
+        """
+        Predicts latency from the cheap EXPLAIN plan. A `sample_rate` fraction
+        of calls (and every call until the family has a model) is also measured
+        with ANALYZE, and the measurement refits the calibration model.
+        Predictions move as the model refits, so they are never cached.
+        """
+        parsed = self._explain_plan(final_query, join_order)
+        if not parsed['total_cost']:
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY, False
+
+        if self.plan_reuse:
+            # A measurement of the same plan beats any prediction
+            reused = self._plan_latency(self._fingerprint(sql_query_template), parsed)
+            if reused is not None:
+                return reused, False
+
+        family = self._family(sql_query_template)
+        if not self.calibrator.ready(family) or self._rng.random() < self.calibration_sample_rate:
+            latency, measured = self._measure_latency(final_query, join_order, sql_query_template, parsed)
+            if measured:
+                self.metrics.incr('calibration_samples')
+                self.calibrator.update(family, parsed, latency)
+            return latency, False
+        return self.calibrator.predict(family, parsed), False
+
+    def evaluate_arms(self, join_order, sql_query_template, arms=None, measure_latency=False):
+        """
+        Costs one join order under several planner-knob arms. The backend runs
+        every arm on one connection, each in a short transaction with SET LOCAL
+        settings, so the session defaults are never changed.
+        args:
+            join_order: list of tables/aliases for the Leading hint
+            sql_query_template: the original query string
+            arms: dict name -> settings, or a list of names from cost.arms
+                  (defaults to all of cost.arms)
+            measure_latency: also run EXPLAIN ANALYZE per arm
+        returns:
+            {"arms": [names], "costs": [...], "latencies": [...] or None}
+            Failed arms get the failure penalty, timed out runs a censored latency.
+        """
+        if arms is None:
+            arms = self.arms
+        elif not isinstance(arms, dict):
+            arms = {name: self.arms[name] for name in arms}
+        names = list(arms)
+        self.metrics.incr('arm_evaluations')
+
+        sql_query_template = self._costed_query(join_order, sql_query_template)
+        with self.metrics.timer('hint'):
+            final_query = f"{self._generate_leading_hint(join_order, sql_query_template)}\n{sql_query_template}"
+
+        costs = [None] * len(names)
+        keys = [None] * len(names)
+        if self.cache:
+            for i, name in enumerate(names):
+                keys[i] = self._cache_key(join_order, sql_query_template, settings=arms[name])
+                costs[i] = self.cache.get(keys[i])
+                self.metrics.incr('cache_hits' if costs[i] is not None else 'cache_misses')
+        latencies = [None] * len(names) if measure_latency else None
+
+        try:
+            if not self._connected:
+                self.connect()
+            pending = [i for i, cost in enumerate(costs) if cost is None]
+            if pending:
+                with self.metrics.timer('explain_arms'):
+                    results = self.backend.explain_arms(final_query, [arms[names[i]] for i in pending], join_order)
+                for i, result in zip(pending, results):
+                    costs[i] = self._arm_cost(names[i], result)
+                    if keys[i] is not None and costs[i] != self.FAILURE_PENALTY:
+                        self.cache.put(keys[i], costs[i])
+            if measure_latency:
+                timeout_ms = self._latency_timeout(self._fingerprint(sql_query_template))
+                with self.metrics.timer('analyze_arms'):
+                    results, _ = self.scheduler.measure(
+                        lambda session: session.explain_arms(final_query, [arms[name] for name in names], join_order,
+                                                             analyze=True, timeout_ms=timeout_ms),
+                        tag={"query": self._fingerprint(sql_query_template), "join_order": list(join_order), "arms": names}
+                    )
+                latencies = [self._arm_latency(name, result, timeout_ms) for name, result in zip(names, results)]
+        except CassetteMiss:
+            self.metrics.incr('cassette_misses')
+            if self.raise_on_miss:
+                raise
+            costs, latencies = self._penalize_arms(costs, latencies)
+        except Exception as e:
+            print(f"Arm evaluation failed: {e}")
+            self.metrics.incr('failures')
+            costs, latencies = self._penalize_arms(costs, latencies)
+
+        return {"arms": names, "costs": costs, "latencies": latencies}
+
+    def _arm_cost(self, name, result):
+        if isinstance(result, Exception):
+            if isinstance(result, CassetteMiss) and self.raise_on_miss:
+                raise result
+            print(f"Arm {name} failed: {result}")
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY
+        with self.metrics.timer('parse'):
+            cost = self.parser.parse_explain_json(result)['total_cost']
+        if not cost:
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY
+        return cost
+
+    def _arm_latency(self, name, result, timeout_ms):
+        if isinstance(result, StatementTimeout):
+            self.metrics.incr('timeouts')
+            self.metrics.incr('censored')
+            return timeout_ms * self.censor_factor
+        if isinstance(result, Exception):
+            if isinstance(result, CassetteMiss) and self.raise_on_miss:
+                raise result
+            print(f"Arm {name} failed: {result}")
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY
+        with self.metrics.timer('parse'):
+            latency = self.parser.parse_explain_json(result)['execution_time']
+        if latency is None:
+            self.metrics.incr('penalties')
+            return self.FAILURE_PENALTY
+        if latency > timeout_ms:
+            self.metrics.incr('censored')
+            return timeout_ms * self.censor_factor
+        return latency
+
+    def _penalize_arms(self, costs, latencies):
+        penalized = sum(1 for c in costs if c is None) + sum(1 for l in (latencies or []) if l is None)
+        self.metrics.incr('penalties', penalized)
+        costs = [self.FAILURE_PENALTY if c is None else c for c in costs]
+        if latencies is not None:
+            latencies = [self.FAILURE_PENALTY if l is None else l for l in latencies]
+        return costs, latencies
+
+    def _plan_latency(self, fingerprint, parsed):
+        key = CostCache.make_key(f"plan:{fingerprint}", [parsed['plan_fingerprint']])
+        if self.cache:
+            latency = self.cache.get(key)
+        else:
+            latency = self._plan_latencies.get(key)
+        if latency is not None:
+            self.metrics.incr('plan_reuse_hits')
+        return latency
+
+    def _store_plan_latency(self, fingerprint, parsed, latency):
+        key = CostCache.make_key(f"plan:{fingerprint}", [parsed['plan_fingerprint']])
+        if self.cache:
+            self.cache.put(key, latency)
+        else:
+            self._plan_latencies[key] = latency
+
+    def calibration_report(self):
+        return self.calibrator.drift_report()
+
+    def _family(self, sql_query_template):
+        # Queries over the same set of tables share a calibration model
+        family = self._families.get(sql_query_template)
+        if family is None:
+            family = "|".join(sorted(set(self._parsed(sql_query_template)['tables'])))
+            self._families[sql_query_template] = family
+        return family
+
+    def _parsed(self, sql_query_template):
+        parsed = self._parsed_queries.get(sql_query_template)
+        if parsed is None:
+            parsed = SQLParser().parse(sql_query_template)
+            self._parsed_queries[sql_query_template] = parsed
+        return parsed
+
+    def _costed_query(self, join_order, sql_query_template):
+        """
+        The query actually sent to the backend for this join order. With
+        cost.prefix_queries, a join order covering only some of the relations
+        is costed on a synthesized query over those relations, their filters
+        and the join predicates among them, so small prefixes are cheap to plan
+        and get their own cost. Complete orders, and orders naming relations the
+        parser does not know, use the original query.
+        """
+        if not self.prefix_queries:
+            return sql_query_template
+        key = (sql_query_template, frozenset(join_order))
+        query = self._prefix_query_cache.get(key)
+        if query is None:
+            query = sql_query_template
+            try:
+                parsed = self._parsed(sql_query_template)
+                if join_order and set(join_order) < set(parsed['aliases']):
+                    query = build_prefix_query(parsed, join_order)
+                    self.metrics.incr('prefix_queries')
+            except Exception as e:
+                print(f"Could not build prefix query, costing the full query: {e}")
+            self._prefix_query_cache[key] = query
+        return query
+
+    def _latency_timeout(self, fingerprint):
+        best = self.best_latency.get(fingerprint)
+        if best is None:
+            return self.max_timeout_ms
+        return min(max(best * self.timeout_factor, self.min_timeout_ms), self.max_timeout_ms)
+
+    def estimate_cost_many(self, join_orders, sql_query_template, concurrency=None, timeout=None):
+        """
+        Blocking wrapper around aestimate_cost_many for synchronous callers.
+        Code already running inside an event loop should await
+        aestimate_cost_many directly.
+        """
+        return asyncio.run(self.aestimate_cost_many(join_orders, sql_query_template, concurrency, timeout))
+
+    async def aestimate_cost_many(self, join_orders, sql_query_template, concurrency=None, timeout=None):
+        """
+        Estimate the cost of several join orders of the same query with up to
+        `concurrency` EXPLAINs in flight on separate pooled connections.
+        args:
+            join_orders: list of join orders, each a list of tables/aliases
+            sql_query_template: the original query string
+            concurrency: max EXPLAINs in flight (defaults to cost.batch.concurrency)
+            timeout: seconds per call before it is cancelled and penalized
+        returns:
+            list of costs in the same order as join_orders
+        """
+        return await self.aestimate_costs([(join_order, sql_query_template) for join_order in join_orders], concurrency, timeout)
+
+    def estimate_costs(self, requests, concurrency=None, timeout=None):
+        """
+        Blocking wrapper around aestimate_costs for synchronous callers.
+        """
+        return asyncio.run(self.aestimate_costs(requests, concurrency, timeout))
+
+    async def aestimate_costs(self, requests, concurrency=None, timeout=None):
+        """
+        Like aestimate_cost_many, for join orders of different queries (one
+        step of several environments). With a batched backend every query's
+        join orders go out as one server batch.
+        args:
+            requests: list of (join_order, sql_query_template)
+        returns:
+            list of costs in the same order as requests
+        """
+        concurrency = concurrency or self.batch_concurrency
+        timeout = timeout if timeout is not None else self.batch_timeout
+        executor = self._get_executor(concurrency)
+        try:
+            return await self._aestimate_costs(executor, requests, concurrency, timeout)
+        finally:
+            self._release_executor(executor)
+
+    async def _aestimate_costs(self, executor, requests, concurrency, timeout):
+        loop = asyncio.get_running_loop()
+        costs = [None] * len(requests)
+        if self.backend.batched and self.reward_mode == 'cost':
+            by_query = {}
+            for i, (join_order, sql_query_template) in enumerate(requests):
+                by_query.setdefault(sql_query_template, []).append(i)
+            batches = [(sql, indices) for sql, indices in by_query.items() if len(indices) > 1]
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, self._estimate_server_batch, [requests[i][0] for i in indices], sql)
+                for sql, indices in batches
+            ))
+            for (sql, indices), batch_costs in zip(batches, results):
+                if batch_costs is not None:
+                    for i, cost in zip(indices, batch_costs):
+                        costs[i] = cost
+        pending = [i for i, cost in enumerate(costs) if cost is None]
+        if not pending:
+            return costs
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def estimate_one(join_order, sql_query_template):
+            async with semaphore:
+                worker = {}
+
+                def run():
+                    worker['thread'] = threading.get_ident()
+                    return self.estimate_cost(join_order, sql_query_template)
+
+                future = loop.run_in_executor(executor, run)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    self.metrics.incr('timeouts')
+                    self.metrics.incr('penalties')
+                    thread = worker.get('thread')
+                    if thread is not None:
+                        self._cancelled_threads.add(thread)
+                    self.backend.cancel(thread)
+                    # Hold the slot until the worker is actually free again
+                    await asyncio.wait([future])
+                    self._cancelled_threads.discard(thread)
+                    return self.FAILURE_PENALTY
+
+        results = await asyncio.gather(*(estimate_one(*requests[i]) for i in pending))
+        for i, cost in zip(pending, results):
+            costs[i] = cost
+        return costs
+
+    def _get_executor(self, concurrency):
+        """
+        Worker threads for at least `concurrency` calls in flight, registered
+        as used until _release_executor. A call asking for more than the
+        current pool gets a larger one; the old pool stays usable by the calls
+        that already hold it and shuts down after the last of them.
+        """
+        with self._executor_lock:
+            if self._executor is None or self._executor_size < concurrency:
+                previous = self._executor
+                self._executor_size = max(self.batch_concurrency, concurrency, self._executor_size)
+                self._executor = ThreadPoolExecutor(max_workers=self._executor_size)
+                if previous is not None and previous not in self._executor_users:
+                    previous.shutdown(wait=False)
+            self._executor_users[self._executor] = self._executor_users.get(self._executor, 0) + 1
+            return self._executor
+
+    def _release_executor(self, executor):
+        with self._executor_lock:
+            users = self._executor_users.get(executor)
+            if users is None:
+                return # close() already shut it down
+            if users > 1:
+                self._executor_users[executor] = users - 1
+                return
+            del self._executor_users[executor]
+            retired = executor is not self._executor
+        if retired:
+            executor.shutdown(wait=False)
+
+    def _estimate_server_batch(self, join_orders, sql_query_template):
+        """
+        Costs all join orders with one backend call (the server-side helper
+        function for PostgreSQL). Cached orders are not sent. Returns None when
+        the backend has no batched path so the caller falls back to one
+        EXPLAIN per join order.
+        """
+        try:
+            if not self._connected:
+                self.connect()
+        except Exception as e:
+            print(f"Query execution failed: {e}")
+            return None
+
+        costs = [None] * len(join_orders)
+        keys = [None] * len(join_orders)
+        if self.cache:
+            for i, join_order in enumerate(join_orders):
+                keys[i] = self._cache_key(join_order, self._costed_query(join_order, sql_query_template))
+                costs[i] = self.cache.get(keys[i])
+                self.metrics.incr('cache_hits' if costs[i] is not None else 'cache_misses')
+        pending = [i for i, cost in enumerate(costs) if cost is None]
+        if not pending:
+            return costs
+
+        # Prefix queries differ per set of joined relations; one batch per query
+        groups = {}
+        for i in pending:
+            groups.setdefault(self._costed_query(join_orders[i], sql_query_template), []).append(i)
+
+        for query, indices in groups.items():
+            with self.metrics.timer('hint'):
+                hints = [self._generate_leading_hint(join_orders[i], query) for i in indices]
+            with self.metrics.timer('explain_many'):
+                results = self.backend.explain_many(hints, query)
+            if results is None:
+                return None
+            self.metrics.incr('server_batches')
+
+            for i, cost in zip(indices, results):
+                if not cost:
+                    self.metrics.incr('penalties')
+                    costs[i] = self.FAILURE_PENALTY
+                    continue
+                costs[i] = cost
+                if keys[i] is not None:
+                    self.cache.put(keys[i], cost)
+        return costs
+
+    def _cache_key(self, join_order, sql_query_template, settings=None):
+        fingerprint = self._fingerprint(sql_query_template)
+        rows_hints = self.feedback.rows_hints(fingerprint) if self.feedback is not None else ""
+        if rows_hints:
+            # Corrected cardinalities change the plan, so they get their own entries
+            fingerprint = f"{fingerprint}+rows{hashlib.sha1(rows_hints.encode('utf-8')).hexdigest()[:12]}"
+        if settings is not None:
+            # Planner-knob arms are always EXPLAIN costs, one entry per setting combination
+            tag = ",".join(f"{name}={value}" for name, value in sorted(settings.items()))
+            fingerprint = f"arm[{tag}]:{fingerprint}"
+        elif self.reward_mode != 'cost':
+            # Latencies and costs must not be mixed up in a persistent cache
+            fingerprint = f"{self.reward_mode}:{fingerprint}"
+        return CostCache.make_key(fingerprint, join_order)
+
+    def _fingerprint(self, sql_query_template):
+        # Normalizing with sqlparse is slow; the workload is a fixed set of templates
+        fingerprint = self._fingerprints.get(sql_query_template)
+        if fingerprint is None:
+            fingerprint = query_fingerprint(sql_query_template)
+            self._fingerprints[sql_query_template] = fingerprint
+        return fingerprint
 
-    def _generate_leading_hint(self, join_order):
+    def _generate_leading_hint(self, join_order, sql_query_template=None):
         """
         Generates /*+ Leading(t1 t2 t3) */ hint.
         Assumes join_order is a list of tables or aliases.
+        With cardinality feedback, Rows(...) hints of the query are appended.
         """
         # join_order might be a flat list ['t1', 't2'] or structure
         # User example: Leading(title movie_info cast_info)
         # We assume flat list for now corresponding to the sequence
         joined_str = " ".join(join_order)
+        rows_hints = ""
+        if self.feedback is not None and sql_query_template is not None:
+            rows_hints = self.feedback.rows_hints(self._fingerprint(sql_query_template))
+        if rows_hints:
+            return f"/*+ Leading({joined_str}) {rows_hints} */"
         return f"/*+ Leading({joined_str}) */"
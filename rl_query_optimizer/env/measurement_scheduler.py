@@ -0,0 +1,123 @@
+import contextlib
+import threading
+from collections import deque
+
+class MeasurementScheduler:
+    """
+    Gates EXPLAIN ANALYZE runs so concurrent measurements do not distort
+    each other's timings, independently of the (higher) limit on cheap
+    EXPLAIN traffic.
+
+    At most `max_concurrent` runs execute at once. `acquire_slot`
+    (CostBackend.measurement_slot) holds a slot for each run and yields the
+    MeasurementSession the run executes on. For PostgreSQL the slot is an
+    advisory lock in the server, so the limit is shared by every process
+    measuring against it. The in-process semaphore only keeps this
+    process's threads from waiting on the server. With `sample_load`, the
+    load is read from the same session (its server_load() returns active
+    backends and cumulative buffer hits/reads, or None) before and after
+    every run, and each measurement is tagged with:
+        active_backends: other backends busy around the run (max of both samples)
+        buffer_hit_ratio: share of buffer accesses served from shared buffers
+                          during the run, server wide
+    A run taken under contention (more than `max_active_backends` busy, or a
+    hit ratio below `min_buffer_hit_ratio`) is repeated up to `max_remeasure`
+    times. If it is still contended, the last result is kept and tagged as
+    contended.
+    """
+
+    def __init__(self, max_concurrent=1, acquire_slot=None, sample_load=True, max_active_backends=2,
+                 min_buffer_hit_ratio=None, max_remeasure=2, history=1000, metrics=None):
+        self.max_concurrent = max(int(max_concurrent), 1)
+        self.acquire_slot = acquire_slot
+        self.sample_load = sample_load
+        self.max_active_backends = max_active_backends
+        self.min_buffer_hit_ratio = min_buffer_hit_ratio
+        self.max_remeasure = max_remeasure
+        self.metrics = metrics
+
+        self.history = deque(maxlen=history) # tag of every recent measurement
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+
+    def measure(self, run, tag=None):
+        """
+        Runs `run(session)` in a measurement slot, re-measuring under
+        contention. `session` is the MeasurementSession holding the slot
+        (None without acquire_slot). Exceptions from `run` (e.g. a statement
+        timeout) propagate unchanged.
+        returns:
+            (result of run, tag dict with the observed load)
+        """
+        slot = self.acquire_slot(self.max_concurrent) if self.acquire_slot is not None else contextlib.nullcontext()
+        with self._slots, slot as session:
+            for attempt in range(self.max_remeasure + 1):
+                before = self._probe(session)
+                result = run(session)
+                after = self._probe(session)
+                load = self._load(before, after)
+                contended = self._contended(load)
+                if not contended:
+                    break
+                self._incr('contended_runs')
+                if attempt < self.max_remeasure:
+                    self._incr('remeasured')
+
+        self._incr('measurements')
+        entry = dict(tag or {})
+        entry.update(load)
+        entry['contended'] = contended
+        entry['attempts'] = attempt + 1
+        if contended:
+            self._incr('contended_measurements')
+        with self._lock:
+            self.history.append(entry)
+        return result, entry
+
+    def stats(self):
+        with self._lock:
+            entries = list(self.history)
+        active = [e['active_backends'] for e in entries if e.get('active_backends') is not None]
+        ratios = [e['buffer_hit_ratio'] for e in entries if e.get('buffer_hit_ratio') is not None]
+        return {
+            "max_concurrent": self.max_concurrent,
+            "recent": len(entries),
+            "recent_contended": sum(1 for e in entries if e['contended']),
+            "mean_active_backends": sum(active) / len(active) if active else None,
+            "mean_buffer_hit_ratio": sum(ratios) / len(ratios) if ratios else None
+        }
+
+    def _probe(self, session):
+        if not self.sample_load or session is None:
+            return None
+        try:
+            return session.server_load()
+        except Exception as e:
+            print(f"Failed to sample server load: {e}")
+            return None
+
+    @staticmethod
+    def _load(before, after):
+        load = {"active_backends": None, "buffer_hit_ratio": None}
+        samples = [s for s in (before, after) if s]
+        if samples:
+            load['active_backends'] = max(s['active_backends'] for s in samples)
+        if before and after:
+            hits = after['blks_hit'] - before['blks_hit']
+            reads = after['blks_read'] - before['blks_read']
+            if hits + reads > 0:
+                load['buffer_hit_ratio'] = hits / float(hits + reads)
+        return load
+
+    def _contended(self, load):
+        if load['active_backends'] is not None and self.max_active_backends is not None \
+                and load['active_backends'] > self.max_active_backends:
+            return True
+        if load['buffer_hit_ratio'] is not None and self.min_buffer_hit_ratio is not None \
+                and load['buffer_hit_ratio'] < self.min_buffer_hit_ratio:
+            return True
+        return False
+
+    def _incr(self, name):
+        if self.metrics is not None:
+            self.metrics.incr(name)
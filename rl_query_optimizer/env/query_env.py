@@ -1,22 +1,65 @@
 import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
-from ..utils.query_graph import QueryGraph
 from .cost_interface import CostInterface
+from .query_record import get_query_record
+from .action_space import get_pair_actions
 
 class QueryEnv(gym.Env):
     metadata = {'render.modes': ['human']}
 
-    def __init__(self, config, queries=None):
+    def __init__(self, config, queries=None, cost_interface=None, shaping_interface=None):
+        """
+        cost_interface / shaping_interface: interfaces shared with other
+        environments (VectorQueryEnv); they are not closed by close()
+        """
         super(QueryEnv, self).__init__()
         self.config = config
-        self.cost_interface = CostInterface(config['database'])
+        self._owns_cost_interface = cost_interface is None
+        self.cost_interface = cost_interface if cost_interface is not None else CostInterface(config['database'], config.get('cost'))
+
+        # "every_step" costs each partial join order with the cost interface.
+        # "terminal" only costs the complete join order, once per episode;
+        # intermediate steps get zero ("zero") or a cheap shaping term from
+        # the in-process simulated backend ("simulated").
+        env_config = config.get('env', {})
+        self.reward_mode = env_config.get('reward_mode', 'every_step')
+        self.intermediate_reward = env_config.get('intermediate_reward', 'zero')
+        self.shaping_scale = env_config.get('shaping_scale', 0.01)
+        if self.reward_mode not in ('every_step', 'terminal'):
+            raise ValueError(f"Unknown env reward mode: {self.reward_mode}")
+        self.shaping_interface = None
+        self._owns_shaping_interface = shaping_interface is None
+        if shaping_interface is not None:
+            self.shaping_interface = shaping_interface
+        elif self.reward_mode == 'terminal' and self.intermediate_reward == 'simulated':
+            # Only what the simulated backend needs: no feedback, baseline or
+            # cache files shared with the real interface
+            cost_config = config.get('cost') or {}
+            shaping_config = {
+                'backend': 'simulated',
+                'reward_mode': 'cost',
+                'cache': {'enabled': False},
+                'simulated': cost_config.get('simulated', {}),
+                'prefix_queries': cost_config.get('prefix_queries', False)
+            }
+            self.shaping_interface = CostInterface(config['database'], shaping_config)
         self.queries = queries if queries else []
         self.current_query = None
+        self.current_record = None
         self.query_graph = None
         
         # Max tables assumption for fixed observation space
-        self.max_tables = 20
+        self.max_tables = config.get('rl', {}).get('max_tables', 20)
+
+        # Every query is parsed once; reset() only picks a record
+        self.records = []
+        for sql in self.queries:
+            record = get_query_record(sql)
+            if not 2 <= record.num_tables <= self.max_tables:
+                print(f"Skipping query with {record.num_tables} relations (supported: 2 to {self.max_tables})")
+                continue
+            self.records.append(record)
         
         # Observation Space:
         # [joined_mask (N), adjacency_flattened (N*N)? or just focus on mask + cost]
@@ -25,9 +68,12 @@ class QueryEnv(gym.Env):
         # - Joined Mask (N)
         # - Current Cost (1)
         # - Last Reward (1)
+        # - Action Mask (num_actions): valid joins of the current state
+        self.pair_actions = get_pair_actions(self.max_tables)
         self.observation_space = spaces.Dict({
             "mask": spaces.Box(low=0, high=1, shape=(self.max_tables,), dtype=np.int8),
-            "cost": spaces.Box(low=0, high=np.inf, shape=(1,), dtype=np.float32)
+            "cost": spaces.Box(low=0, high=np.inf, shape=(1,), dtype=np.float32),
+            "action_mask": spaces.MultiBinary(self.pair_actions.num_actions)
         })
 
         # Action Space:
@@ -35,76 +81,165 @@ class QueryEnv(gym.Env):
         # Since number of tables is dynamic, we can model action as index into valid_joins list?
         # Or a fixed discrete space N*(N-1)/2. 
         # User suggested: N * (N-1) / 2
-        num_actions = self.max_tables * (self.max_tables - 1) // 2
-        self.action_space = spaces.Discrete(num_actions)
+        self.action_space = spaces.Discrete(self.pair_actions.num_actions)
 
         self.tables = []
-        self.joined_tables = set()
+        # Join state: bit i of joined_mask is set once self.tables[i] is joined,
+        # prefix[:prefix_len] holds the table indices in join order
+        self.joined_mask = 0
+        self.full_mask = 0
+        self.prefix = np.full(self.max_tables, -1, dtype=np.int16)
+        self.prefix_len = 0
+        self.join_order = [] # names of prefix[:prefix_len], passed to the cost interface
+        self._bit_shifts = np.arange(self.max_tables, dtype=np.uint64)
+        self.action_mask = np.zeros(self.pair_actions.num_actions, dtype=np.int8)
+        self._edge_masks = {} # query fingerprint -> actions along join graph edges
 
-    def reset(self, seed=None, query=None):
+    def reset(self, seed=None, query=None, options=None):
+        """
+        Starts an episode on `query` (parsed on first use), on
+        options["query_index"], or on a random workload query.
+        """
         super().reset(seed=seed)
         
         if query:
-            self.current_query = query
-        elif self.queries:
-            # Pick strict or random?
-            self.current_query = self.queries[0] # simplistic
+            record = get_query_record(query)
+        elif options and 'query_index' in options:
+            record = self.records[options['query_index']]
+        elif self.records:
+            record = self.records[self.np_random.integers(len(self.records))]
+        else:
+            raise ValueError("QueryEnv has no queries to reset to")
+        if record.num_tables > self.max_tables:
+            raise ValueError(f"Query has {record.num_tables} relations, more than max_tables={self.max_tables}")
             
-        # Parse query and build graph (mocked for now)
-        # self.tables = extract_tables(self.current_query)
-        self.tables = ["t1", "t2", "t3"] # Mock
-        self.joined_tables = set()
+        self.current_record = record
+        self.current_query = record.sql
+        self.query_graph = record.graph
+        self.tables = record.tables
+        self.full_mask = (1 << len(self.tables)) - 1
+        self.joined_mask = 0
+        self.prefix.fill(-1)
+        self.prefix_len = 0
+        self.join_order = []
+        self._edge_mask = self._edge_masks.get(record.fingerprint)
+        if self._edge_mask is None:
+            self._edge_mask = self._edge_masks[record.fingerprint] = self.pair_actions.edge_mask(record.edges)
+        self._update_action_mask()
         
         # Initial State
-        return self._get_observation(), {}
+        return self._get_observation(), {"action_mask": self.action_mask}
 
     def step(self, action):
+        error = self.apply_action(action)
+        if error:
+            return self._get_observation(), -10.0, False, False, {"error": error, "action_mask": self.action_mask}
+        request = self.cost_request()
+        cost = request[0].estimate_cost(request[1], request[2]) if request is not None else None
+        return self.finish_step(cost)
+
+    # step() in three phases, so VectorQueryEnv can cost the steps of all its
+    # environments in one batch between apply_action and finish_step
+
+    def apply_action(self, action):
+        """
+        Joins the pair of `action` into the current state.
+        returns:
+            None, or an error message when the action is invalid and the
+            state is unchanged
+        """
         # Action map: index -> (i, j)
         pair = self._action_to_pair(action)
         t1_idx, t2_idx = pair
         
         # Check validity
         if t1_idx >= len(self.tables) or t2_idx >= len(self.tables):
-            return self._get_observation(), -10.0, False, False, {"error": "Invalid index"}
-            
-        t1 = self.tables[t1_idx]
-        t2 = self.tables[t2_idx]
+            return "Invalid index"
+        # Left-deep: a step joins one new table to the current result, along a
+        # join predicate when the query has one (see PairActions.join_mask).
+        # Masked actions are rejected before any costing.
+        if not 0 <= action < self.pair_actions.num_actions or not self.action_mask[action]:
+            return "Invalid join"
         
-        # Check if already joined or joinable
-        # For a left-deep tree, we usually join a new table to the current result.
-        # Impl: Mark t1, t2 as joined.
+        for idx in (t1_idx, t2_idx):
+            bit = 1 << idx
+            if not self.joined_mask & bit:
+                self.joined_mask |= bit
+                self.prefix[self.prefix_len] = idx
+                self.prefix_len += 1
+                self.join_order.append(self.tables[idx])
         
-        self.joined_tables.add(t1)
-        self.joined_tables.add(t2)
+        self._update_action_mask()
+        return None
+
+    def cost_request(self):
+        """
+        (cost interface, join order, query) the reward of the step just
+        applied needs, or None when it needs no cost.
+        """
+        done = self.joined_mask == self.full_mask
+        if self.reward_mode == 'every_step' or done:
+            return self.cost_interface, list(self.join_order), self.current_query
+        if self.shaping_interface is not None:
+            return self.shaping_interface, list(self.join_order), self.current_query
+        return None
+
+    def finish_step(self, cost=None):
+        """
+        Reward and step result for the applied step, given the answer to its
+        cost_request().
+        """
+        done = self.joined_mask == self.full_mask
         
         # Reward
-        cost = self.cost_interface.estimate_cost(list(self.joined_tables), self.current_query)
-        reward = -cost 
-        
-        done = len(self.joined_tables) == len(self.tables)
+        info = {"action_mask": self.action_mask}
+        if self.reward_mode == 'every_step' or done:
+            reward = -cost
+            info['cost'] = cost
+            if done and self.cost_interface.baselines is not None:
+                baseline = self.cost_interface.baseline(self.current_query)
+                if baseline is not None:
+                    info['baseline_cost'] = baseline['cost']
+        elif self.shaping_interface is not None:
+            reward = -self.shaping_scale * cost
+        else:
+            reward = 0.0
         
-        return self._get_observation(), reward, done, False, {}
+        return self._get_observation(), reward, done, False, info
+
+    def close(self):
+        if self._owns_cost_interface:
+            self.cost_interface.close()
+        if self.shaping_interface is not None and self._owns_shaping_interface:
+            self.shaping_interface.close()
+
+    @property
+    def joined_tables(self):
+        """
+        Set of joined table names, derived from the bitmask.
+        """
+        return set(self.join_order)
 
     def _get_observation(self):
-        mask = np.zeros(self.max_tables, dtype=np.int8)
-        for i, t in enumerate(self.tables):
-            if t in self.joined_tables:
-                mask[i] = 1
+        mask = ((np.uint64(self.joined_mask) >> self._bit_shifts) & np.uint64(1)).astype(np.int8)
         
         # Placeholder cost
         return {
             "mask": mask,
-            "cost": np.array([0.0], dtype=np.float32)
+            "cost": np.array([0.0], dtype=np.float32),
+            "action_mask": self.action_mask
         }
 
+    def _update_action_mask(self):
+        # A fresh array per step, so masks handed out earlier (replay buffer) stay valid
+        if self.joined_mask == self.full_mask:
+            self.action_mask = np.zeros(self.pair_actions.num_actions, dtype=np.int8)
+        else:
+            self.action_mask = self.pair_actions.join_mask(self.joined_mask, len(self.tables), self._edge_mask).astype(np.int8)
+
     def _action_to_pair(self, action):
-        # Convert scalar action to (i, j)
-        # k = (2n - 1 - i) * i / 2 + j - i - 1  ... classic upper triangular mapping
-        # Naive: iterate
-        k = 0
-        for i in range(self.max_tables):
-            for j in range(i + 1, self.max_tables):
-                if k == action:
-                    return (i, j)
-                k += 1
-        return (0, 0)
+        # Convert scalar action to (i, j) with the shared lookup table
+        if not 0 <= action < self.pair_actions.num_actions:
+            return (0, 0)
+        i, j = self.pair_actions.action_to_pair[action]
+        return (int(i), int(j))
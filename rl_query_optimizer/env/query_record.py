@@ -0,0 +1,51 @@
+import threading
+from ..utils.query_graph import QueryGraph
+from ..utils.sql_parser import SQLParser, local_filters, query_fingerprint
+
+class QueryRecord:
+    """
+    Everything QueryEnv needs about one workload query, parsed once.
+
+    tables are the names the query refers to its relations by (aliases, or
+    the table name when there is none), so they can go straight into a
+    Leading hint. Index i of `tables` is bit i of the env's join bitmask;
+    neighbors[i] is the bitmask of tables sharing a join predicate with it.
+    """
+
+    def __init__(self, sql, parsed):
+        self.sql = sql
+        self.fingerprint = query_fingerprint(sql)
+        self.relations = dict(parsed.get('aliases') or {t: t for t in parsed.get('tables', [])})
+        self.tables = list(self.relations)
+        self.table_index = {alias: i for i, alias in enumerate(self.tables)}
+
+        self.graph = QueryGraph()
+        self.graph.build_from_parsed(parsed)
+        self.edges = sorted(
+            tuple(sorted((self.table_index[a], self.table_index[b])))
+            for a, b in self.graph.graph.edges() if a in self.table_index and b in self.table_index
+        )
+        self.neighbors = [0] * len(self.tables)
+        for i, j in self.edges:
+            self.neighbors[i] |= 1 << j
+            self.neighbors[j] |= 1 << i
+
+        self.filters = local_filters(parsed)
+
+    @property
+    def num_tables(self):
+        return len(self.tables)
+
+_records = {}
+_records_lock = threading.Lock()
+
+def get_query_record(sql):
+    """
+    Parsed record of a query, shared by every env in the process.
+    """
+    record = _records.get(sql)
+    if record is None:
+        record = QueryRecord(sql, SQLParser().parse(sql))
+        with _records_lock:
+            record = _records.setdefault(sql, record)
+    return record
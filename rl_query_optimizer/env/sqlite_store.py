@@ -0,0 +1,19 @@
+import os
+import sqlite3
+
+def open_store(path, busy_timeout=30.0):
+    """
+    Opens a SQLite store that several processes may share (subprocess env
+    workers all open the same cache, feedback and baseline files). WAL lets
+    readers work while one process writes, and a writer waits up to
+    `busy_timeout` seconds for the lock instead of failing with "database is
+    locked". Within a process the connection is shared between threads; the
+    stores serialize access with their own lock.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    db = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(f"PRAGMA busy_timeout = {int(busy_timeout * 1000)}")
+    return db
@@ -1,10 +1,15 @@
 import numpy as np
 import torch
+from .action_space import get_pair_actions
 
 class StateEncoder:
     def __init__(self, config):
         self.max_tables = config.get('max_tables', 20)
         self.feature_dim = self.max_tables * 2 + 1 # join_mask + remaining_mask + cost
+        if self.max_tables > 64:
+            raise ValueError("Join state bitmasks support at most 64 tables")
+        self._bit_shifts = np.arange(self.max_tables, dtype=np.uint64)
+        self.pair_actions = get_pair_actions(self.max_tables)
 
     def encode(self, joined_tables, all_tables, current_cost):
         """
@@ -42,5 +47,47 @@ class StateEncoder:
         state_vec = np.concatenate([join_mask, remaining_mask, [scaled_cost]])
         return state_vec
 
+    def encode_mask(self, joined_mask, num_tables, current_cost):
+        """
+        Same vector as encode(), computed with bit operations from the env's
+        join bitmask (bit i set once table i of the query is joined).
+        """
+        joined = (np.uint64(joined_mask) >> self._bit_shifts) & np.uint64(1)
+        all_tables = (np.uint64((1 << min(num_tables, self.max_tables)) - 1) >> self._bit_shifts) & np.uint64(1)
+        scaled_cost = np.log1p(current_cost) if current_cost > 0 else 0.0
+        return np.concatenate([
+            joined.astype(np.float32),
+            (all_tables & ~joined & np.uint64(1)).astype(np.float32),
+            [scaled_cost]
+        ])
+
+    def encode_masks(self, joined_masks, num_tables, current_costs):
+        """
+        encode_mask() for a batch of environments at once.
+        args:
+            joined_masks, num_tables, current_costs: sequences of length B
+        returns:
+            np.array: shape (B, feature_dim), float32
+        """
+        joined_masks = np.asarray(joined_masks, dtype=np.uint64)[:, None]
+        all_masks = np.array([(1 << min(int(n), self.max_tables)) - 1 for n in num_tables], dtype=np.uint64)
+        joined = (joined_masks >> self._bit_shifts) & np.uint64(1)
+        all_tables = (all_masks[:, None] >> self._bit_shifts) & np.uint64(1)
+        current_costs = np.asarray(current_costs, dtype=np.float64)
+        scaled_costs = np.log1p(np.maximum(current_costs, 0.0))
+        return np.concatenate([
+            joined.astype(np.float32),
+            (all_tables & ~joined & np.uint64(1)).astype(np.float32),
+            scaled_costs.astype(np.float32)[:, None]
+        ], axis=1)
+
+    def action_mask(self, joined_mask, num_tables, edges=None):
+        """
+        Boolean mask over pair actions for a join state (see
+        PairActions.join_mask); `edges` restricts it to the join graph.
+        """
+        edge_mask = self.pair_actions.edge_mask(edges) if edges is not None else None
+        return self.pair_actions.join_mask(joined_mask, num_tables, edge_mask)
+
     def get_input_shape(self):
         return (self.feature_dim,)
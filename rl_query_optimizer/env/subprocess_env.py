@@ -0,0 +1,314 @@
+import copy
+import ctypes
+import json
+import multiprocessing as mp
+import os
+import signal
+import time
+import numpy as np
+from gymnasium import spaces
+from .query_env import QueryEnv
+from .state_encoder import StateEncoder
+
+class _SharedBuffers:
+    """
+    Per-environment rows of the step results in shared memory. The parent
+    creates them; each worker writes only its own row. Mappable again in a
+    restarted worker, since the RawArrays are handed to every new process.
+    """
+
+    def __init__(self, ctx, num_envs, feature_dim, num_actions):
+        self.shapes = {
+            "states": ((num_envs, feature_dim), np.float32),
+            "action_masks": ((num_envs, num_actions), np.bool_),
+            "rewards": ((num_envs,), np.float32),
+            "terminated": ((num_envs,), np.bool_),
+            "truncated": ((num_envs,), np.bool_),
+            "final_states": ((num_envs, feature_dim), np.float32),
+            "final_action_masks": ((num_envs, num_actions), np.bool_)
+        }
+        self.raw = {
+            name: ctx.RawArray(ctypes.c_uint8, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            for name, (shape, dtype) in self.shapes.items()
+        }
+
+    def views(self):
+        return {
+            name: np.frombuffer(self.raw[name], dtype=dtype).reshape(shape)
+            for name, (shape, dtype) in self.shapes.items()
+        }
+
+def _worker(index, config, queries, max_steps, buffers, conn):
+    """
+    Runs one QueryEnv with its own CostInterface (and database connections)
+    in a worker process. Commands arrive on `conn`; states, masks and rewards
+    go into row `index` of the shared buffers, only small info dicts are
+    sent back.
+    """
+    env = QueryEnv(config, queries=queries)
+    encoder = StateEncoder(config['rl'])
+    views = buffers.views()
+    cost = 0.0
+    episode_reward = 0.0
+    episode_steps = 0
+
+    def write_state(states, action_masks):
+        states[index] = encoder.encode_mask(env.joined_mask, len(env.tables), cost)
+        action_masks[index] = env.action_mask
+
+    try:
+        while True:
+            command, arg = conn.recv()
+            if command == 'reset':
+                obs, _ = env.reset(seed=arg)
+                cost = obs['cost'][0]
+                episode_reward = 0.0
+                episode_steps = 0
+                write_state(views['states'], views['action_masks'])
+                conn.send(None)
+            elif command == 'step':
+                obs, reward, terminated, _, info = env.step(arg)
+                cost = obs['cost'][0]
+                episode_reward += reward
+                episode_steps += 1
+                truncated = not terminated and episode_steps >= max_steps
+                info = {k: v for k, v in info.items() if k != 'action_mask'}
+                views['rewards'][index] = reward
+                views['terminated'][index] = terminated
+                views['truncated'][index] = truncated
+                if terminated or truncated:
+                    write_state(views['final_states'], views['final_action_masks'])
+                    info['episode_reward'] = float(episode_reward)
+                    info['episode_steps'] = episode_steps
+                    obs, _ = env.reset()
+                    cost = obs['cost'][0]
+                    episode_reward = 0.0
+                    episode_steps = 0
+                write_state(views['states'], views['action_masks'])
+                conn.send(info)
+            elif command == 'metrics':
+                conn.send(env.cost_interface.metrics_snapshot())
+            elif command == 'close':
+                break
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        env.close()
+        conn.close()
+
+class SubprocessVectorQueryEnv:
+    """
+    Same interface as VectorQueryEnv, with every environment in its own
+    worker process: state encoding, plan parsing and the cost layer run in
+    parallel instead of under one GIL. Each worker owns a QueryEnv with its
+    own CostInterface and connection pool (training.workers.pool_size
+    connections), so num_envs is bounded by cores and by the database's
+    connection limit. Cost requests are not batched across environments.
+
+    Cost state is per worker. The SQLite files named by cost.cache.path,
+    cost.feedback.path and cost.baselines.path are shared: they are opened
+    in WAL mode with a busy timeout, and a cache miss reads through to the
+    file. The in-memory cache, the calibration models and the Rows hints
+    learned from feedback are not shared, so each worker builds its own.
+    measurement.max_concurrent is held per database server with advisory
+    locks (MeasurementScheduler), so it bounds the ANALYZE runs of all
+    workers together. The thread limit in each worker only matters for
+    that worker's own threads.
+
+    Step results come back through shared-memory numpy buffers. A worker
+    that dies or does not answer within training.workers.step_timeout
+    seconds is restarted; its episode is dropped and reported as truncated
+    with info["worker_restarted"], without a transition to learn from.
+    """
+
+    def __init__(self, config, queries=None, num_envs=None, max_steps=None):
+        training_config = config.get('training', {})
+        worker_config = training_config.get('workers', {})
+        self.num_envs = num_envs or training_config.get('num_envs', 8)
+        self.max_steps = max_steps or training_config.get('max_steps_per_episode', 20)
+        self.step_timeout = worker_config.get('step_timeout', 300)
+        self.start_timeout = worker_config.get('start_timeout', 120)
+        self.max_restarts = worker_config.get('max_restarts', 3)
+        self.restarts = 0
+
+        # Each worker makes one cost call at a time; a large per-worker pool
+        # would only hold idle connections
+        self.config = copy.deepcopy(config)
+        self.config['database'].setdefault('pool', {})['max_size'] = worker_config.get('pool_size', 2)
+        self.config['database']['pool']['min_size'] = min(
+            self.config['database']['pool'].get('min_size', 1), self.config['database']['pool']['max_size']
+        )
+        self.queries = queries
+
+        self.encoder = StateEncoder(config['rl'])
+        self.feature_dim = self.encoder.feature_dim
+        # No QueryEnv (and CostInterface) in the parent
+        self.num_actions = self.encoder.pair_actions.num_actions
+        self.action_space = spaces.Discrete(self.num_actions)
+
+        self._ctx = mp.get_context(worker_config.get('start_method', 'spawn'))
+        self._buffers = _SharedBuffers(self._ctx, self.num_envs, self.feature_dim, self.num_actions)
+        self._views = self._buffers.views()
+        self._processes = [None] * self.num_envs
+        self._conns = [None] * self.num_envs
+        self._failures = [0] * self.num_envs # consecutive restarts per worker
+        self._started = [False] * self.num_envs # answered once since its (re)start
+        for i in range(self.num_envs):
+            self._start_worker(i)
+
+    def reset(self, seed=None):
+        """
+        returns:
+            states (num_envs, feature_dim), action_masks (num_envs, num_actions)
+        """
+        for i in range(self.num_envs):
+            self._send(i, ('reset', None if seed is None else seed + i))
+        for i in range(self.num_envs):
+            if self._receive(i) is False:
+                self._restart_worker(i)
+        return self._views['states'].copy(), self._views['action_masks'].copy()
+
+    def step(self, actions):
+        """
+        Sends one action to every worker, then collects all results; the
+        workers step in parallel.
+        returns:
+            states, action_masks, rewards, terminated, truncated, infos
+        """
+        for i, action in enumerate(actions):
+            self._send(i, ('step', int(action)))
+
+        infos = [{} for _ in range(self.num_envs)]
+        restarted = []
+        for i in range(self.num_envs):
+            info = self._receive(i)
+            if info is False:
+                restarted.append(i)
+                continue
+            self._failures[i] = 0
+            infos[i] = info
+
+        rewards = self._views['rewards'].copy()
+        terminated = self._views['terminated'].copy()
+        truncated = self._views['truncated'].copy()
+        for i in np.flatnonzero(terminated | truncated):
+            infos[i]['final_state'] = self._views['final_states'][i].copy()
+            infos[i]['final_action_mask'] = self._views['final_action_masks'][i].copy()
+        for i in restarted:
+            # The dead worker's rows may be half written; its episode is dropped
+            self._restart_worker(i)
+            rewards[i] = 0.0
+            terminated[i] = False
+            truncated[i] = True
+            infos[i] = {"worker_restarted": True}
+
+        return self._views['states'].copy(), self._views['action_masks'].copy(), rewards, terminated, truncated, infos
+
+    def metrics_snapshots(self):
+        """
+        Cost layer metrics of every worker (None for a worker that failed to
+        answer, which is restarted).
+        """
+        for i in range(self.num_envs):
+            self._send(i, ('metrics', None))
+        snapshots = []
+        for i in range(self.num_envs):
+            snapshot = self._receive(i)
+            if snapshot is False:
+                self._restart_worker(i)
+                snapshot = None
+            snapshots.append(snapshot)
+        return snapshots
+
+    def export_metrics(self, path):
+        """
+        Writes every worker's cost layer metrics and their summed counters
+        as JSON.
+        """
+        snapshots = self.metrics_snapshots()
+        counters = {}
+        for snapshot in snapshots:
+            for name, value in (snapshot or {}).get('counters', {}).items():
+                counters[name] = counters.get(name, 0) + value
+        data = {"counters": counters, "worker_restarts": self.restarts, "workers": snapshots}
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2, default=str)
+        return data
+
+    def close(self):
+        for i in range(self.num_envs):
+            self._send(i, ('close', None))
+        deadline = time.monotonic() + 10
+        for process, conn in zip(self._processes, self._conns):
+            process.join(timeout=max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                # A stopped (SIGSTOP) worker only acts on SIGTERM once continued
+                if hasattr(signal, 'SIGCONT'):
+                    try:
+                        os.kill(process.pid, signal.SIGCONT)
+                    except OSError:
+                        pass
+                process.terminate()
+                process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join(timeout=5)
+            if process.is_alive():
+                print(f"Env worker pid {process.pid} did not exit")
+            conn.close()
+
+    def _start_worker(self, i):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker,
+            args=(i, self.config, self.queries, self.max_steps, self._buffers, child_conn),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._processes[i] = process
+        self._conns[i] = parent_conn
+        self._started[i] = False
+
+    def _send(self, i, message):
+        # A dead worker shows up in the following _receive
+        try:
+            self._conns[i].send(message)
+        except (BrokenPipeError, OSError):
+            pass
+
+    def _receive(self, i):
+        """
+        Reply of worker i, or False when it died or timed out.
+        """
+        conn = self._conns[i]
+        # Spawning a worker imports the package and builds its env first
+        timeout = self.step_timeout if self._started[i] else self.start_timeout
+        try:
+            if conn.poll(timeout):
+                reply = conn.recv()
+                self._started[i] = True
+                return reply
+            print(f"Env worker {i} did not answer within {timeout}s")
+        except (EOFError, OSError) as e:
+            print(f"Env worker {i} failed: {e!r}")
+        return False
+
+    def _restart_worker(self, i):
+        self._failures[i] += 1
+        if self._failures[i] > self.max_restarts:
+            raise RuntimeError(f"Env worker {i} failed {self._failures[i]} times in a row")
+        self.restarts += 1
+        process = self._processes[i]
+        if process.is_alive():
+            process.kill()
+        process.join(timeout=5)
+        self._conns[i].close()
+        print(f"Restarting env worker {i} (exit code {process.exitcode})")
+        self._start_worker(i)
+        self._send(i, ('reset', None))
+        if self._receive(i) is False:
+            self._restart_worker(i)
@@ -0,0 +1,116 @@
+import numpy as np
+from .query_env import QueryEnv
+from .state_encoder import StateEncoder
+
+class VectorQueryEnv:
+    """
+    num_envs QueryEnvs stepped in lockstep, each on its own random workload
+    query. All environments share one CostInterface, and the cost requests of
+    a step go to it as one batch (CostInterface.estimate_costs), so EXPLAINs
+    of different episodes run concurrently or as one server batch.
+
+    States come back encoded and stacked: (num_envs, feature_dim) float32,
+    with (num_envs, num_actions) boolean action masks. An episode that ends
+    (all tables joined, or max_steps reached) is reset right away; its last
+    state is in the step's info as "final_state" / "final_action_mask".
+    """
+
+    def __init__(self, config, queries=None, num_envs=None, max_steps=None):
+        training_config = config.get('training', {})
+        self.num_envs = num_envs or training_config.get('num_envs', 8)
+        self.max_steps = max_steps or training_config.get('max_steps_per_episode', 20)
+
+        first = QueryEnv(config, queries=queries)
+        self.envs = [first] + [
+            QueryEnv(config, queries=queries, cost_interface=first.cost_interface, shaping_interface=first.shaping_interface)
+            for _ in range(self.num_envs - 1)
+        ]
+        self.cost_interface = first.cost_interface
+        self.encoder = StateEncoder(config['rl'])
+        self.feature_dim = self.encoder.feature_dim
+        self.action_space = first.action_space
+        self.num_actions = first.action_space.n
+
+        self._costs = np.zeros(self.num_envs, dtype=np.float32) # "cost" of each env's last observation
+        self.episode_rewards = np.zeros(self.num_envs, dtype=np.float64)
+        self.episode_steps = np.zeros(self.num_envs, dtype=np.int64)
+
+    def reset(self, seed=None):
+        """
+        returns:
+            states (num_envs, feature_dim), action_masks (num_envs, num_actions)
+        """
+        for i, env in enumerate(self.envs):
+            obs, _ = env.reset(seed=None if seed is None else seed + i)
+            self._costs[i] = obs['cost'][0]
+        self.episode_rewards[:] = 0.0
+        self.episode_steps[:] = 0
+        return self._states(), self._action_masks()
+
+    def step(self, actions):
+        """
+        Applies one action per environment and costs all resulting join
+        orders in one batch.
+        returns:
+            states, action_masks, rewards, terminated, truncated, infos
+        """
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        terminated = np.zeros(self.num_envs, dtype=bool)
+        truncated = np.zeros(self.num_envs, dtype=bool)
+        infos = [{} for _ in range(self.num_envs)]
+
+        requests = {} # cost interface -> [(env index, join order, query)]
+        applied = []
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            error = env.apply_action(int(action))
+            if error:
+                rewards[i] = -10.0
+                infos[i] = {"error": error, "action_mask": env.action_mask}
+                continue
+            applied.append(i)
+            request = env.cost_request()
+            if request is not None:
+                interface, join_order, sql = request
+                requests.setdefault(interface, []).append((i, join_order, sql))
+
+        costs = [None] * self.num_envs
+        for interface, batch in requests.items():
+            results = interface.estimate_costs([(join_order, sql) for _, join_order, sql in batch])
+            for (i, _, _), cost in zip(batch, results):
+                costs[i] = cost
+
+        for i in applied:
+            obs, rewards[i], terminated[i], _, infos[i] = self.envs[i].finish_step(costs[i])
+            self._costs[i] = obs['cost'][0]
+
+        self.episode_rewards += rewards
+        self.episode_steps += 1
+        truncated = ~terminated & (self.episode_steps >= self.max_steps)
+        for i in np.flatnonzero(terminated | truncated):
+            env = self.envs[i]
+            infos[i]['final_state'] = self.encoder.encode_mask(env.joined_mask, len(env.tables), self._costs[i])
+            infos[i]['final_action_mask'] = env.action_mask.astype(bool)
+            infos[i]['episode_reward'] = float(self.episode_rewards[i])
+            infos[i]['episode_steps'] = int(self.episode_steps[i])
+            obs, _ = env.reset()
+            self._costs[i] = obs['cost'][0]
+            self.episode_rewards[i] = 0.0
+            self.episode_steps[i] = 0
+
+        return self._states(), self._action_masks(), rewards, terminated, truncated, infos
+
+    def export_metrics(self, path):
+        return self.cost_interface.export_metrics(path)
+
+    def close(self):
+        # The first environment owns the shared cost interfaces
+        for env in reversed(self.envs):
+            env.close()
+
+    def _states(self):
+        return self.encoder.encode_masks(
+            [env.joined_mask for env in self.envs], [len(env.tables) for env in self.envs], self._costs
+        )
+
+    def _action_masks(self):
+        return np.stack([env.action_mask for env in self.envs]).astype(bool)
@@ -7,13 +7,23 @@ class ReplayBuffer:
         self.capacity = capacity
         self.buffer = deque(maxlen=capacity)
 
-    def push(self, state, action, reward, next_state, done):
-        self.buffer.append((state, action, reward, next_state, done))
+    def push(self, state, action, reward, next_state, done, next_mask=None):
+        """
+        next_mask: valid actions in next_state (all False when done), or None
+        """
+        self.buffer.append((state, action, reward, next_state, done, next_mask))
 
     def sample(self, batch_size):
+        """
+        returns:
+            state, action, reward, next_state, done, next_mask; next_mask is
+            None unless every sampled transition has one
+        """
         batch = random.sample(self.buffer, batch_size)
-        state, action, reward, next_state, done = map(np.stack, zip(*batch))
-        return state, action, reward, next_state, done
+        state, action, reward, next_state, done, next_mask = zip(*batch)
+        state, action, reward, next_state, done = map(np.stack, (state, action, reward, next_state, done))
+        next_mask = None if any(m is None for m in next_mask) else np.stack(next_mask).astype(bool)
+        return state, action, reward, next_state, done, next_mask
 
     def __len__(self):
         return len(self.buffer)
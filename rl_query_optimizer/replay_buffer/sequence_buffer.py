@@ -11,7 +11,8 @@ class SequenceReplayBuffer:
 
     def push_episode(self, episode):
         """
-        episode: list of (state, action, reward, next_state, done) tuples
+        episode: list of (state, action, reward, next_state, done) or
+                 (state, action, reward, next_state, done, next_mask) tuples
         """
         self.buffer.append(episode)
 
@@ -34,13 +35,15 @@ class SequenceReplayBuffer:
         next_state_batch = []
         done_batch = []
         mask_batch = [] # To mask out padding
+        next_mask_batch = [] # Valid actions in next_state, if every episode has them
+        with_action_masks = all(len(ep[0]) > 5 and ep[0][5] is not None for ep in batch_episodes)
         
         first_state_shape = batch_episodes[0][0][0].shape
         
         for ep in batch_episodes:
             seq_len = len(ep)
             # Unzip
-            s, a, r, ns, d = zip(*ep)
+            s, a, r, ns, d = zip(*(t[:5] for t in ep))
             
             # Pad
             pad_len = max_len - seq_len
@@ -50,6 +53,7 @@ class SequenceReplayBuffer:
             r_padded = np.array(r)
             ns_padded = np.array(ns)
             d_padded = np.array(d)
+            nm_padded = np.array([t[5] for t in ep], dtype=bool) if with_action_masks else None
             
             if pad_len > 0:
                 s_zero = np.zeros((pad_len, *first_state_shape))
@@ -61,12 +65,15 @@ class SequenceReplayBuffer:
                 a_padded = np.concatenate([a_padded, np.zeros(pad_len)])
                 r_padded = np.concatenate([r_padded, np.zeros(pad_len)])
                 d_padded = np.concatenate([d_padded, np.ones(pad_len)]) # Terminal padding
+                if with_action_masks:
+                    nm_padded = np.concatenate([nm_padded, np.ones((pad_len, nm_padded.shape[1]), dtype=bool)])
             
             state_batch.append(s_padded)
             action_batch.append(a_padded)
             reward_batch.append(r_padded)
             next_state_batch.append(ns_padded)
             done_batch.append(d_padded)
+            next_mask_batch.append(nm_padded)
             
             # Mask: 1 for valid, 0 for padding
             mask = np.concatenate([np.ones(seq_len), np.zeros(pad_len)])
@@ -77,7 +84,8 @@ class SequenceReplayBuffer:
                 np.array(reward_batch), 
                 np.array(next_state_batch), 
                 np.array(done_batch),
-                np.array(mask_batch))
+                np.array(mask_batch),
+                np.array(next_mask_batch) if with_action_masks else None)
 
     def __len__(self):
         return len(self.buffer)
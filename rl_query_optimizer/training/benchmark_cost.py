@@ -0,0 +1,176 @@
+import argparse
+import copy
+import glob
+import json
+import os
+import platform
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+import yaml
+from ..env.cost_interface import CostInterface
+from ..utils.metrics import LatencyHistogram
+from ..utils.sql_parser import parse_sql
+
+def load_config(path="rl_query_optimizer/config.yaml"):
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+def sample_workload(query_dir, num_queries, orders_per_query, seed=0):
+    """
+    Fixed sample of (sql, join_order) pairs: random queries from `query_dir`
+    and random join order prefixes of at least two relations over their
+    aliases, like the partial orders QueryEnv costs step by step.
+    """
+    rng = random.Random(seed)
+    files = sorted(glob.glob(os.path.join(query_dir, "*.sql")))
+    rng.shuffle(files)
+
+    workload = []
+    for path in files:
+        if len({sql for sql, _ in workload}) >= num_queries:
+            break
+        with open(path, 'r') as f:
+            sql = f.read().strip()
+        aliases = list(parse_sql(sql)['aliases'])
+        if len(aliases) < 2:
+            continue
+        for _ in range(orders_per_query):
+            order = aliases[:]
+            rng.shuffle(order)
+            workload.append((sql, order[:rng.randint(2, len(order))]))
+    return workload
+
+def run_configuration(config, workload, pool_size, concurrency, cache_state):
+    """
+    Replays the workload through a fresh CostInterface and times every
+    estimate_cost call. cache_state is "off", "cold" (empty in-memory cache)
+    or "warm" (one untimed pass first).
+    """
+    config = copy.deepcopy(config)
+    config['database'].setdefault('pool', {})['max_size'] = pool_size
+    cost_config = config.setdefault('cost', {})
+    cost_config.setdefault('batch', {})['concurrency'] = concurrency
+    cost_config['cache'] = dict(cost_config.get('cache') or {}, enabled=cache_state != 'off', path=None)
+
+    cost_interface = CostInterface(config['database'], cost_config)
+    cost_interface.connect()
+    if cache_state == 'warm':
+        for sql, order in workload:
+            cost_interface.estimate_cost(order, sql)
+    cost_interface.metrics.reset()
+
+    histogram = LatencyHistogram()
+    by_size = {}
+
+    def timed_call(item):
+        sql, order = item
+        start = time.perf_counter()
+        cost_interface.estimate_cost(order, sql)
+        return len(order), time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        samples = [timed_call(item) for item in workload]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(timed_call, workload))
+    wall = time.perf_counter() - start
+
+    for size, seconds in samples:
+        histogram.record(seconds)
+        by_size.setdefault(size, LatencyHistogram()).record(seconds)
+    snapshot = cost_interface.metrics_snapshot()
+    cost_interface.close()
+
+    summary = histogram.summary()
+    return {
+        "backend": cost_config.get('backend', 'postgres'),
+        "pool_size": pool_size,
+        "concurrency": concurrency,
+        "cache": cache_state,
+        "calls": len(samples),
+        "wall_seconds": wall,
+        "calls_per_second": len(samples) / wall if wall > 0 else None,
+        "p50_ms": summary.get('p50_ms'),
+        "p95_ms": summary.get('p95_ms'),
+        "p99_ms": summary.get('p99_ms'),
+        "latency": summary,
+        "by_join_size": {str(size): h.summary() for size, h in sorted(by_size.items())},
+        "counters": snapshot['counters']
+    }
+
+def format_value(value, spec, unit=""):
+    """
+    `value` formatted with `spec`, or "n/a" when there is none (no calls were
+    timed).
+    """
+    return "n/a" if value is None else f"{value:{spec}}{unit}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CostInterface.estimate_cost throughput and latency")
+    parser.add_argument("--config", type=str, default="rl_query_optimizer/config.yaml")
+    parser.add_argument("--backend", type=str, default=None, help="postgres, cassette or simulated (default: cost.backend)")
+    parser.add_argument("--queries", type=str, default="rl_query_optimizer/data/train_queries")
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--orders-per-query", type=int, default=10)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--cache", type=str, nargs="+", default=["off", "cold", "warm"], choices=["off", "cold", "warm"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default="models/cost_benchmark.json")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    config.setdefault('cost', {})
+    if args.backend:
+        config['cost']['backend'] = args.backend
+    backend = config['cost'].get('backend', 'postgres')
+    # Only a live database has connections to size
+    pool_sizes = args.pool_sizes if backend == 'postgres' else args.pool_sizes[:1]
+
+    workload = sample_workload(args.queries, args.num_queries, args.orders_per_query, seed=args.seed)
+    if not workload:
+        print(f"No join orders sampled: no query in {args.queries} has two or more relations")
+        return
+    print(f"Benchmarking {len(workload)} join orders against the {backend} backend")
+
+    results = []
+    for pool_size in pool_sizes:
+        for concurrency in args.concurrency:
+            for cache_state in args.cache:
+                result = run_configuration(config, workload, pool_size, concurrency, cache_state)
+                results.append(result)
+                print(f"pool={pool_size} concurrency={concurrency} cache={cache_state}: "
+                      f"{format_value(result['calls_per_second'], '.1f')} calls/s, "
+                      f"p50={format_value(result['p50_ms'], '.2f', 'ms')} "
+                      f"p95={format_value(result['p95_ms'], '.2f', 'ms')} "
+                      f"p99={format_value(result['p99_ms'], '.2f', 'ms')}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {
+            "hostname": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count()
+        },
+        "backend": backend,
+        "workload": {
+            "queries": args.queries,
+            "num_queries": args.num_queries,
+            "orders_per_query": args.orders_per_query,
+            "join_orders": len(workload),
+            "seed": args.seed
+        },
+        "results": results
+    }
+    directory = os.path.dirname(args.out)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
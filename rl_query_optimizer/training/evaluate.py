@@ -16,7 +16,7 @@ def run_evaluation(agent, env, encoder, episodes=10, mode="agent"):
     
     for i in range(episodes):
         raw_state, _ = env.reset()
-        state = encoder.encode(env.joined_tables, env.tables, 0)
+        state = encoder.encode_mask(env.joined_mask, len(env.tables), 0)
         
         hidden = None # For DRQN
         done = False
@@ -27,21 +27,22 @@ def run_evaluation(agent, env, encoder, episodes=10, mode="agent"):
                 if hasattr(agent, 'select_action'):
                     # Check if DRQN or DQN
                     if isinstance(agent, DRQNAgent):
-                        action, hidden = agent.select_action(state, hidden, eval_mode=True)
+                        action, hidden = agent.select_action(state, hidden, eval_mode=True, action_mask=raw_state['action_mask'])
                     else:
-                        action = agent.select_action(state, eval_mode=True)
+                        action = agent.select_action(state, eval_mode=True, action_mask=raw_state['action_mask'])
             elif mode == "random":
-                action = env.action_space.sample()
+                action = env.action_space.sample(mask=raw_state['action_mask'])
             elif mode == "greedy":
                 # Heuristic: try all valid joins, pick cheapest
                 # This requires env to support 'peek' or we just estimate outside
                 # Simplification: Random for now, or access internal cost model
-                action = env.action_space.sample() 
+                action = env.action_space.sample(mask=raw_state['action_mask'])
             
             next_raw_state, reward, done, truncated, info = env.step(action)
             
             current_cost = next_raw_state['cost'][0]
-            state = encoder.encode(env.joined_tables, env.tables, current_cost)
+            state = encoder.encode_mask(env.joined_mask, len(env.tables), current_cost)
+            raw_state = next_raw_state
             
             episode_reward += reward
         
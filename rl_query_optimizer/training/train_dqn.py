@@ -2,9 +2,9 @@ import yaml
 import numpy as np
 import torch
 import os
-from ..env.query_env import QueryEnv
+from ..env.vector_env import VectorQueryEnv
+from ..env.subprocess_env import SubprocessVectorQueryEnv
 from ..agents.dqn import DQNAgent
-from ..env.state_encoder import StateEncoder
 
 def load_config(path="rl_query_optimizer/config.yaml"):
     with open(path, 'r') as f:
@@ -32,62 +32,70 @@ def train_dqn():
     print(f"Loaded {len(train_queries)} training queries.") 
     
     print("Initializing Environment...")
-    env = QueryEnv(config, queries=train_queries)
-    encoder = StateEncoder(config['rl'])
+    # num_envs episodes in lockstep: one batched forward and one cost batch per step,
+    # or one worker process per environment with training.vector_env: subprocess
+    if config['training'].get('vector_env', 'lockstep') == 'subprocess':
+        env = SubprocessVectorQueryEnv(config, queries=train_queries)
+    else:
+        env = VectorQueryEnv(config, queries=train_queries)
     
-    state_dim = encoder.feature_dim
-    action_dim = env.action_space.n
+    state_dim = env.feature_dim
+    action_dim = env.num_actions
     
     print("Initializing Agent...")
     agent = DQNAgent(state_dim, action_dim, config)
     
     num_episodes = config['training']['episodes']
-    print(f"Starting training on {config['rl']['device']} for {num_episodes} episodes...")
+    # Gradient updates per vector step; the default keeps the single-env
+    # ratio of one update per transition
+    updates_per_step = config['training'].get('updates_per_step') or env.num_envs
+    print(f"Starting training on {config['rl']['device']} for {num_episodes} episodes with {env.num_envs} environments...")
     
-    for episode in range(num_episodes):
-        if episode == 0:
-            print("Starting Episode 0...")
-        # Curriculum: Switch queries based on episode progress
-        # if episode > 1000: env.queries = hard_queries
+    # Curriculum: Switch queries based on episode progress
+    # if episode > 1000: env.queries = hard_queries
+    states, action_masks = env.reset()
+    episode = 0
+    
+    while episode < num_episodes:
+        actions = agent.select_actions(states, action_masks)
         
-        raw_state, _ = env.reset()
-        # Encode state
-        state = encoder.encode(env.joined_tables, env.tables, 0)
+        next_states, next_action_masks, rewards, terminated, truncated, infos = env.step(actions)
         
-        done = False
-        total_reward = 0
-        step_count = 0
-        max_steps = config['training'].get('max_steps_per_episode', 20)
+        for i in range(env.num_envs):
+            if infos[i].get('worker_restarted'):
+                continue
+            finished = terminated[i] or truncated[i]
+            # Finished environments were reset already; their transition ends in the final state
+            next_state = infos[i]['final_state'] if finished else next_states[i]
+            next_mask = infos[i]['final_action_mask'] if finished else next_action_masks[i]
+            agent.memory.push(states[i], actions[i], rewards[i], next_state, terminated[i], next_mask)
         
-        while not done and step_count < max_steps:
-            step_count += 1
-            if episode == 0 and step_count % 10 == 0:
-                 print(f"Ep 0 Step {step_count}...")
-            action = agent.select_action(state)
-            
-            next_raw_state, reward, done, truncated, info = env.step(action)
-            
-            # Encode next state
-            current_cost = next_raw_state['cost'][0] # Approx
-            next_state = encoder.encode(env.joined_tables, env.tables, current_cost)
-            
-            agent.memory.push(state, action, reward, next_state, done)
-            
-            state = next_state
-            total_reward += reward
-            
+        for _ in range(updates_per_step):
             loss = agent.update()
-            
-        agent.update_epsilon()
         
-        if episode % 10 == 0:
-            print(f"Episode {episode}, Total Reward: {total_reward}, Epsilon: {agent.epsilon:.2f}")
+        states, action_masks = next_states, next_action_masks
+        
+        for i in np.flatnonzero(terminated | truncated):
+            if episode >= num_episodes:
+                break
+            if infos[i].get('worker_restarted'):
+                continue
+            agent.update_epsilon()
             
-        if episode % config['training']['eval_freq'] == 0:
-            # Save model
-            if not os.path.exists(config['training']['checkpoint_dir']):
-                os.makedirs(config['training']['checkpoint_dir'])
-            torch.save(agent.policy_net.state_dict(), f"{config['training']['checkpoint_dir']}/dqn_{episode}.pt")
+            if episode % 10 == 0:
+                print(f"Episode {episode}, Total Reward: {infos[i]['episode_reward']}, Epsilon: {agent.epsilon:.2f}")
+                
+            if episode % config['training']['eval_freq'] == 0:
+                # Save model
+                if not os.path.exists(config['training']['checkpoint_dir']):
+                    os.makedirs(config['training']['checkpoint_dir'])
+                torch.save(agent.policy_net.state_dict(), f"{config['training']['checkpoint_dir']}/dqn_{episode}.pt")
+            episode += 1
+
+    metrics_path = os.path.join(config['training']['checkpoint_dir'], "dqn_cost_metrics.json")
+    env.export_metrics(metrics_path)
+    print(f"Cost layer metrics written to {metrics_path}")
+    env.close()
 
 if __name__ == "__main__":
     train_dqn()
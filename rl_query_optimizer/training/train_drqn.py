@@ -42,7 +42,7 @@ def train_drqn():
     
     for episode in range(num_episodes):
         raw_state, _ = env.reset()
-        state = encoder.encode(env.joined_tables, env.tables, 0)
+        state = encoder.encode_mask(env.joined_mask, len(env.tables), 0)
         
         hidden = None # Reset hidden state at start of episode
         
@@ -52,16 +52,17 @@ def train_drqn():
         episode_storage = []
         
         while not done:
-            action, next_hidden = agent.select_action(state, hidden)
+            action, next_hidden = agent.select_action(state, hidden, action_mask=raw_state['action_mask'])
             
             next_raw_state, reward, done, truncated, info = env.step(action)
             
             current_cost = next_raw_state['cost'][0]
-            next_state = encoder.encode(env.joined_tables, env.tables, current_cost)
+            next_state = encoder.encode_mask(env.joined_mask, len(env.tables), current_cost)
             
-            episode_storage.append((state, action, reward, next_state, done))
+            episode_storage.append((state, action, reward, next_state, done, next_raw_state['action_mask']))
             
             state = next_state
+            raw_state = next_raw_state
             hidden = next_hidden
             total_reward += reward
             
@@ -79,5 +80,10 @@ def train_drqn():
                 os.makedirs(config['training']['checkpoint_dir'])
             torch.save(agent.policy_net.state_dict(), f"{config['training']['checkpoint_dir']}/drqn_{episode}.pt")
 
+    metrics_path = os.path.join(config['training']['checkpoint_dir'], "drqn_cost_metrics.json")
+    env.cost_interface.export_metrics(metrics_path)
+    print(f"Cost layer metrics written to {metrics_path}")
+    env.close()
+
 if __name__ == "__main__":
     train_drqn()
@@ -0,0 +1,114 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram: geometric buckets whose width grows with the
+    value, so every recorded latency is kept within a bounded relative error
+    (1 / precision) in constant memory, from microseconds to minutes.
+    """
+
+    def __init__(self, precision=64):
+        self.precision = precision
+        self._log_base = math.log1p(1.0 / precision)
+        self.buckets = defaultdict(int) # bucket index -> count
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        self.buckets[int(math.log(micros) / self._log_base)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, p):
+        """
+        Latency in seconds below which p percent of the recorded values fall.
+        """
+        if not self.count:
+            return None
+        rank = max(math.ceil(p / 100.0 * self.count), 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Midpoint of the bucket, clamped to what was actually observed
+                micros = math.exp((index + 0.5) * self._log_base)
+                return min(max(micros / 1e6, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000,
+            "min_ms": self.min * 1000,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000
+        }
+
+class Metrics:
+    """
+    Thread-safe registry of named counters and latency histograms.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe(self, name, seconds):
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = LatencyHistogram()
+            self.histograms[name].record(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: h.summary() for name, h in self.histograms.items()}
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def export(self, path, extra=None):
+        """
+        Writes the snapshot (plus any extra sections) as JSON.
+        """
+        data = self.snapshot()
+        if extra:
+            data.update(extra)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=2)
+        return data
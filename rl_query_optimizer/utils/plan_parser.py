@@ -1,3 +1,4 @@
+import hashlib
 import json
 
 class PlanParser:
@@ -18,15 +19,30 @@ class PlanParser:
             plan_data = plan_data[0]
             
         plan_node = plan_data.get('Plan', {})
+        plan_tree = self._extract_plan_tree(plan_node)
         
         return {
             "execution_time": plan_data.get('Execution Time'), # timestamp or float
             "planning_time": plan_data.get('Planning Time'),
             "total_cost": plan_node.get('Total Cost'),
             "startup_cost": plan_node.get('Startup Cost'),
-            "plan_tree": self._extract_plan_tree(plan_node)
+            "plan_tree": plan_tree,
+            "plan_fingerprint": self.plan_fingerprint(plan_tree)
         }
 
+    def plan_fingerprint(self, plan_tree):
+        """
+        Stable hash of the physical plan shape: node types, join types,
+        relations, aliases, indexes and the order of children. Costs and row
+        estimates are left out, so Leading orders that PostgreSQL turns into
+        the same plan get the same fingerprint.
+        """
+        return hashlib.sha1(self._plan_signature(plan_tree).encode('utf-8')).hexdigest()
+
+    def _plan_signature(self, node):
+        label = "|".join(str(node.get(field) or '') for field in ('node_type', 'join_type', 'relation', 'alias', 'index_name'))
+        return "(" + label + "".join(self._plan_signature(child) for child in node.get('children', [])) + ")"
+
     def _extract_plan_tree(self, node):
         """
         Recursively extract plan structure
@@ -35,8 +51,12 @@ class PlanParser:
             "node_type": node.get('Node Type'),
             "cost": node.get('Total Cost'),
             "rows": node.get('Plan Rows'),
+            "actual_rows": node.get('Actual Rows'), # only with ANALYZE, per loop
+            "loops": node.get('Actual Loops'),
             "relation": node.get('Relation Name'),
             "alias": node.get('Alias'),
+            "join_type": node.get('Join Type'),
+            "index_name": node.get('Index Name'),
             "children": []
         }
         
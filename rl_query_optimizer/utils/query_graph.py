@@ -11,11 +11,14 @@ class QueryGraph:
         Args:
             parsed_query (dict): output from SQLParser.parse()
                                  Expects keys: 'tables', 'joins' (list of Join objects or strings)
+                                 and optionally 'aliases' (alias -> table)
         """
         
-        # Add nodes for each table
-        for table in parsed_query.get('tables', []):
-            self.add_relation(table)
+        # Add nodes for each relation, named like the join predicates refer to it
+        aliases = parsed_query.get('aliases') or {t: t for t in parsed_query.get('tables', [])}
+        for alias, table in aliases.items():
+            self.add_relation(alias)
+            self.graph.nodes[alias]['table'] = table
             
         # Add edges for joins
         for join_pred in parsed_query.get('joins', []):
@@ -1,7 +1,14 @@
+import hashlib
+import re
 import sqlparse
 from sqlparse.sql import IdentifierList, Identifier, Where, Comparison
 from sqlparse.tokens import Keyword, DML
 
+# Top-level lexer for WHERE clauses: quoted literals and identifiers stay whole
+_CONJUNCT_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\(|\)|\w+|\s+|.", re.S)
+_QUOTED_RE = re.compile(r"'(?:[^']|'')*'")
+_QUALIFIED_COLUMN_RE = re.compile(r"\b([A-Za-z_]\w*)\s*\.\s*[A-Za-z_\"]")
+
 class SQLParser:
     def __init__(self):
         pass
@@ -34,7 +41,9 @@ class SQLParser:
         # But let's build a structure that we can improve.
         
         extracted_tables = self._extract_tables(parsed)
+        extracted_aliases = self._extract_aliases(parsed)
         extracted_predicates = self._extract_predicates(parsed)
+        extracted_conjuncts = self._extract_conjuncts(parsed, extracted_aliases)
         
         # Separate predicates into joins and filters
         for pred in extracted_predicates:
@@ -45,12 +54,24 @@ class SQLParser:
 
         return {
             "tables": extracted_tables,
+            "aliases": extracted_aliases,
             "joins": joins,
-            "predicates": predicates
+            "predicates": predicates,
+            "conjuncts": extracted_conjuncts
         }
 
     def _extract_tables(self, token):
-        tables = []
+        return [name for name, _ in self._extract_relations(token)]
+
+    def _extract_aliases(self, token):
+        """
+        Maps the name each relation is referenced by (alias, or the table
+        name itself when there is none) to the real table name.
+        """
+        return {alias: name for name, alias in self._extract_relations(token)}
+
+    def _extract_relations(self, token):
+        relations = []
         from_seen = False
         
         # This is a heuristic parser. 
@@ -64,16 +85,23 @@ class SQLParser:
             
             if from_seen:
                 if isinstance(item, IdentifierList):
-                    for identifier in item.get_identifiers():
-                        tables.append(identifier.get_real_name())
+                    identifiers = list(item.get_identifiers())
                 elif isinstance(item, Identifier):
-                    tables.append(item.get_real_name())
-                elif item.ttype is Keyword:
-                    # Stop if we hit WHERE, etc
-                    if item.value.upper() in ['WHERE', 'GROUP BY', 'ORDER BY']:
-                         from_seen = False
+                    identifiers = [item]
+                else:
+                    identifiers = []
+                    if item.ttype is Keyword:
+                        # Stop if we hit WHERE, etc
+                        if item.value.upper() in ['WHERE', 'GROUP BY', 'ORDER BY']:
+                             from_seen = False
+                for identifier in identifiers:
+                    if not isinstance(identifier, Identifier):
+                        continue
+                    name = identifier.get_real_name()
+                    if name:
+                        relations.append((name, identifier.get_alias() or name))
                          
-        return [t for t in tables if t]
+        return relations
 
     def _extract_predicates(self, token):
         predicates = []
@@ -90,6 +118,49 @@ class SQLParser:
                      predicates.append(str(item))
         return predicates
 
+    def _extract_conjuncts(self, token, aliases):
+        """
+        Splits the WHERE clause on its top-level ANDs. Unlike _extract_predicates
+        this keeps every condition (BETWEEN ... AND ..., LIKE, IS NULL, IN lists,
+        parenthesized OR groups) and records which relations each one references.
+        """
+        where_clause = next((t for t in token.tokens if isinstance(t, Where)), None)
+        if where_clause is None:
+            return []
+        text = re.sub(r"^\s*WHERE\b", "", str(where_clause), flags=re.I).strip().rstrip(';')
+
+        conjuncts = []
+        current = []
+        depth = 0
+        open_betweens = 0
+        for part in _CONJUNCT_TOKEN_RE.findall(text):
+            if part == '(':
+                depth += 1
+            elif part == ')':
+                depth -= 1
+            elif depth == 0 and part.upper() == 'BETWEEN':
+                open_betweens += 1
+            elif depth == 0 and part.upper() == 'AND':
+                if open_betweens:
+                    # The AND of "x BETWEEN a AND b" does not end the condition
+                    open_betweens -= 1
+                else:
+                    conjuncts.append("".join(current).strip())
+                    current = []
+                    continue
+            current.append(part)
+        conjuncts.append("".join(current).strip())
+
+        return [
+            {"predicate": predicate, "aliases": self._referenced_aliases(predicate, aliases)}
+            for predicate in conjuncts if predicate
+        ]
+
+    def _referenced_aliases(self, predicate, aliases):
+        unquoted = _QUOTED_RE.sub("''", predicate)
+        referenced = {name for name in _QUALIFIED_COLUMN_RE.findall(unquoted) if name in aliases}
+        return sorted(referenced)
+
     def _is_join_predicate(self, predicate_str):
         # Heuristic: if both sides have a dot '.', it's likely a join
         # e.g. "t1.id = t2.movie_id"
@@ -103,3 +174,51 @@ class SQLParser:
 def parse_sql(sql):
     parser = SQLParser()
     return parser.parse(sql)
+
+def local_filters(parsed_query):
+    """
+    Conditions of a parsed query (SQLParser.parse) that reference a single
+    relation, as alias -> list of predicates. Taken from the conjuncts, so
+    BETWEEN, IS NULL, IN and parenthesized OR filters are included.
+    """
+    filters = {}
+    for conjunct in parsed_query.get('conjuncts', []):
+        if len(conjunct['aliases']) == 1:
+            filters.setdefault(conjunct['aliases'][0], []).append(conjunct['predicate'])
+    return filters
+
+def build_prefix_query(parsed_query, relations):
+    """
+    Synthesizes a query over a subset of the relations of a parsed query
+    (SQLParser.parse): those relations, their local filters and the join
+    predicates among them. Used to cost a partial join order without planning
+    the whole query. Conditions that reference no qualified column cannot be
+    attributed to a relation and are left out.
+    """
+    selected = set(relations)
+    from_items = [
+        name if alias == name else f"{name} AS {alias}"
+        for alias, name in parsed_query['aliases'].items() if alias in selected
+    ]
+    conditions = [
+        conjunct['predicate'] for conjunct in parsed_query.get('conjuncts', [])
+        if conjunct['aliases'] and set(conjunct['aliases']) <= selected
+    ]
+    sql = "SELECT count(*) FROM " + ", ".join(from_items)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql
+
+def normalize_query(sql):
+    """
+    Canonical form of a query used for fingerprinting: comments stripped,
+    keywords upper-cased, whitespace collapsed and trailing ';' removed.
+    """
+    formatted = sqlparse.format(sql, strip_comments=True, keyword_case='upper')
+    return " ".join(formatted.split()).rstrip(';').strip()
+
+def query_fingerprint(sql):
+    """
+    Stable hex digest identifying a query independent of formatting.
+    """
+    return hashlib.sha1(normalize_query(sql).encode('utf-8')).hexdigest()
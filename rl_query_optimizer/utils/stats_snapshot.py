@@ -0,0 +1,333 @@
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import re
+from .sql_parser import local_filters
+
+TABLES_SQL = """
+SELECT c.relname, c.reltuples, c.relpages
+FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind = 'r' AND n.nspname = %s
+"""
+
+# anyarray columns are round-tripped through text so psycopg2 returns lists
+COLUMNS_SQL = """
+SELECT tablename, attname, null_frac, n_distinct,
+       most_common_vals::text::text[], most_common_freqs,
+       histogram_bounds::text::text[]
+FROM pg_stats
+WHERE schemaname = %s
+"""
+
+# Key columns in index key order (INCLUDE columns left out); an expression
+# key has no attribute and shows up as NULL in its position
+INDEXES_SQL = """
+SELECT t.relname, i.relname, array_agg(a.attname ORDER BY k.position), ix.indisunique
+FROM pg_index ix
+JOIN pg_class t ON t.oid = ix.indrelid
+JOIN pg_class i ON i.oid = ix.indexrelid
+JOIN pg_namespace n ON n.oid = t.relnamespace
+CROSS JOIN LATERAL unnest(ix.indkey::int2[]) WITH ORDINALITY AS k(attnum, position)
+LEFT JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum AND k.attnum > 0
+WHERE n.nspname = %s AND k.position <= ix.indnkeyatts
+GROUP BY t.relname, i.relname, ix.indisunique
+"""
+
+# PostgreSQL's own fallbacks (selfuncs.h) for predicates it cannot estimate
+DEFAULT_EQ_SEL = 0.005
+DEFAULT_INEQ_SEL = 1.0 / 3.0
+DEFAULT_MATCH_SEL = 0.005
+
+COMPARISON_RE = re.compile(r"^\s*(\w+)\.(\w+)\s*(=|!=|<>|<=|>=|<|>)\s*(.+?)\s*$", re.DOTALL)
+LIKE_RE = re.compile(r"^\s*(\w+)\.(\w+)\s+(NOT\s+)?(I?LIKE)\s+'(.*)'\s*$", re.IGNORECASE | re.DOTALL)
+NULL_RE = re.compile(r"^\s*(\w+)\.(\w+)\s+IS\s+(NOT\s+)?NULL\s*$", re.IGNORECASE)
+BETWEEN_RE = re.compile(r"^\s*(\w+)\.(\w+)\s+BETWEEN\s+(.+?)\s+AND\s+(.+?)\s*$", re.IGNORECASE | re.DOTALL)
+IN_RE = re.compile(r"^\s*(\w+)\.(\w+)\s+(NOT\s+)?IN\s*\((.*)\)\s*$", re.IGNORECASE | re.DOTALL)
+JOIN_RE = re.compile(r"^\s*(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)\s*$")
+
+def export_stats_snapshot(db_config, path, schema='public'):
+    """
+    Dumps table sizes, pg_stats column statistics and index metadata of a
+    schema into a gzipped JSON file that CardinalityEstimator can load.
+    """
+    import psycopg2
+
+    conn = psycopg2.connect(
+        dbname=db_config['dbname'],
+        user=db_config['user'],
+        password=db_config['password'],
+        host=db_config['host'],
+        port=db_config['port']
+    )
+    tables = {}
+    try:
+        with conn.cursor() as cur:
+            cur.execute(TABLES_SQL, (schema,))
+            for name, reltuples, relpages in cur.fetchall():
+                tables[name] = {"rows": max(float(reltuples), 0.0), "pages": relpages, "columns": {}, "indexes": []}
+
+            cur.execute(COLUMNS_SQL, (schema,))
+            for table, column, null_frac, n_distinct, mcv, mcf, histogram in cur.fetchall():
+                if table not in tables:
+                    continue
+                tables[table]['columns'][column] = {
+                    "null_frac": null_frac,
+                    "n_distinct": n_distinct,
+                    "mcv": mcv or [],
+                    "mcf": mcf or [],
+                    "histogram": histogram or []
+                }
+
+            cur.execute(INDEXES_SQL, (schema,))
+            for table, index, columns, unique in cur.fetchall():
+                if table in tables:
+                    tables[table]['indexes'].append({"name": index, "columns": columns, "unique": unique})
+    finally:
+        conn.close()
+
+    body = json.dumps(tables, sort_keys=True, separators=(',', ':'))
+    snapshot = {
+        "schema": schema,
+        "version": hashlib.md5(body.encode('utf-8')).hexdigest(),
+        "tables": tables
+    }
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+    return snapshot
+
+def _literal(text):
+    text = text.strip()
+    if len(text) >= 2 and text[0] == "'" and text[-1] == "'":
+        return text[1:-1].replace("''", "'")
+    return text
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _like_regex(pattern, case_insensitive):
+    parts = []
+    for ch in pattern:
+        if ch == '%':
+            parts.append('.*')
+        elif ch == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(ch))
+    return re.compile("^" + "".join(parts) + "$", (re.IGNORECASE if case_insensitive else 0) | re.DOTALL)
+
+class CardinalityEstimator:
+    """
+    Estimates base-table and join cardinalities from a stats snapshot in the
+    style of PostgreSQL's selectivity functions, without touching the database.
+
+    Predicates are the strings produced by SQLParser.parse(), e.g.
+    "t.production_year > 2010" or "ci.note LIKE '%(producer)%'".
+    """
+
+    def __init__(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        self.version = snapshot.get('version')
+        self.tables = snapshot.get('tables', {})
+        self._numeric_histograms = {}
+
+    def table_rows(self, table, default=1000.0):
+        info = self.tables.get(table)
+        return info['rows'] if info else default
+
+    def index_count(self, table):
+        info = self.tables.get(table)
+        return len(info['indexes']) if info else 0
+
+    def has_index_on(self, table, column):
+        info = self.tables.get(table)
+        if not info:
+            return False
+        return any(index['columns'] and index['columns'][0] == column for index in info['indexes'])
+
+    def ndistinct(self, table, column):
+        stats = self._column(table, column)
+        rows = self.table_rows(table)
+        if not stats or not stats['n_distinct']:
+            return max(rows, 1.0)
+        n_distinct = stats['n_distinct']
+        # Negative values are a fraction of the row count
+        return max(-n_distinct * rows if n_distinct < 0 else n_distinct, 1.0)
+
+    def estimate_table(self, table, predicates=()):
+        """
+        Rows of `table` surviving its local predicates (independence assumed).
+        """
+        rows = self.table_rows(table)
+        for predicate in predicates:
+            rows *= self.predicate_selectivity(table, predicate)
+        return max(rows, 1.0)
+
+    def join_selectivity(self, table_a, column_a, table_b, column_b):
+        stats_a = self._column(table_a, column_a) or {}
+        stats_b = self._column(table_b, column_b) or {}
+        not_null = (1.0 - (stats_a.get('null_frac') or 0.0)) * (1.0 - (stats_b.get('null_frac') or 0.0))
+        return not_null / max(self.ndistinct(table_a, column_a), self.ndistinct(table_b, column_b))
+
+    def estimate_join(self, parsed_query, aliases=None):
+        """
+        Cardinality of joining `aliases` (default: every relation) of a query
+        parsed by SQLParser, applying local filters and the join predicates
+        among them.
+        """
+        relations = parsed_query.get('aliases', {})
+        if aliases is None:
+            aliases = list(relations)
+        aliases = [alias for alias in aliases if alias in relations]
+        if not aliases:
+            return 0.0
+        selected = set(aliases)
+
+        filters = local_filters(parsed_query)
+
+        rows = 1.0
+        for alias in aliases:
+            rows *= self.estimate_table(relations[alias], filters.get(alias, []))
+        for predicate in parsed_query.get('joins', []):
+            match = JOIN_RE.match(predicate)
+            if not match:
+                continue
+            a, col_a, b, col_b = match.groups()
+            if a in selected and b in selected and a != b:
+                rows *= self.join_selectivity(relations[a], col_a, relations[b], col_b)
+        return max(rows, 1.0)
+
+    def predicate_selectivity(self, table, predicate):
+        match = NULL_RE.match(predicate)
+        if match:
+            null_frac = (self._column(table, match.group(2)) or {}).get('null_frac') or 0.0
+            return 1.0 - null_frac if match.group(3) else null_frac
+
+        match = LIKE_RE.match(predicate)
+        if match:
+            selectivity = self._like_selectivity(table, match.group(2), match.group(5), match.group(4).upper() == 'ILIKE')
+            return 1.0 - selectivity if match.group(3) else selectivity
+
+        match = BETWEEN_RE.match(predicate)
+        if match:
+            return self._range_selectivity(table, match.group(2), _literal(match.group(3)), _literal(match.group(4)))
+
+        match = IN_RE.match(predicate)
+        if match:
+            values = [_literal(v) for v in match.group(4).split(',')]
+            selectivity = min(sum(self._eq_selectivity(table, match.group(2), v) for v in values), 1.0)
+            return 1.0 - selectivity if match.group(3) else selectivity
+
+        match = COMPARISON_RE.match(predicate)
+        if match:
+            column, op, value = match.group(2), match.group(3), _literal(match.group(4))
+            if op == '=':
+                return self._eq_selectivity(table, column, value)
+            if op in ('!=', '<>'):
+                return 1.0 - self._eq_selectivity(table, column, value)
+            if op in ('<', '<='):
+                return self._range_selectivity(table, column, None, value)
+            return self._range_selectivity(table, column, value, None)
+
+        return DEFAULT_INEQ_SEL
+
+    def _column(self, table, column):
+        info = self.tables.get(table)
+        return info['columns'].get(column) if info else None
+
+    def _eq_selectivity(self, table, column, value):
+        stats = self._column(table, column)
+        if not stats:
+            return DEFAULT_EQ_SEL
+        mcv, mcf = stats['mcv'], stats['mcf']
+        if value in mcv:
+            return mcf[mcv.index(value)]
+        # Spread what the MCVs don't cover evenly over the remaining distinct values
+        rest = 1.0 - sum(mcf) - (stats['null_frac'] or 0.0)
+        others = self.ndistinct(table, column) - len(mcv)
+        return max(rest, 0.0) / max(others, 1.0)
+
+    def _range_selectivity(self, table, column, low, high):
+        stats = self._column(table, column)
+        low, high = _number(low) if low is not None else None, _number(high) if high is not None else None
+        if not stats or (low is None and high is None):
+            return DEFAULT_INEQ_SEL
+
+        selectivity = 0.0
+        for value, freq in zip(stats['mcv'], stats['mcf']):
+            number = _number(value)
+            if number is not None and (low is None or number >= low) and (high is None or number <= high):
+                selectivity += freq
+
+        histogram = self._numeric_histogram(table, column)
+        if histogram:
+            rest = max(1.0 - sum(stats['mcf']) - (stats['null_frac'] or 0.0), 0.0)
+            upper = self._histogram_fraction(histogram, high) if high is not None else 1.0
+            lower = self._histogram_fraction(histogram, low) if low is not None else 0.0
+            selectivity += max(upper - lower, 0.0) * rest
+        elif not stats['mcv']:
+            return DEFAULT_INEQ_SEL
+        return min(selectivity, 1.0)
+
+    def _numeric_histogram(self, table, column):
+        key = (table, column)
+        if key not in self._numeric_histograms:
+            stats = self._column(table, column) or {}
+            bounds = [_number(b) for b in stats.get('histogram', [])]
+            self._numeric_histograms[key] = bounds if bounds and None not in bounds else None
+        return self._numeric_histograms[key]
+
+    @staticmethod
+    def _histogram_fraction(bounds, value):
+        """
+        Fraction of the histogram population below `value`, interpolating
+        linearly inside the bucket that contains it.
+        """
+        if value <= bounds[0]:
+            return 0.0
+        if value >= bounds[-1]:
+            return 1.0
+        i = bisect.bisect_right(bounds, value) - 1
+        width = bounds[i + 1] - bounds[i]
+        within = (value - bounds[i]) / width if width > 0 else 0.5
+        return (i + within) / (len(bounds) - 1)
+
+    def _like_selectivity(self, table, column, pattern, case_insensitive):
+        stats = self._column(table, column)
+        if not stats:
+            return DEFAULT_MATCH_SEL
+        regex = _like_regex(pattern, case_insensitive)
+
+        selectivity = sum(freq for value, freq in zip(stats['mcv'], stats['mcf']) if regex.match(value))
+        histogram = stats['histogram']
+        if histogram:
+            rest = max(1.0 - sum(stats['mcf']) - (stats['null_frac'] or 0.0), 0.0)
+            matched = sum(1 for value in histogram if regex.match(value))
+            # Never trust an empty sample completely
+            fraction = max(matched / len(histogram), DEFAULT_MATCH_SEL)
+            selectivity += fraction * rest
+        elif not stats['mcv']:
+            return DEFAULT_MATCH_SEL
+        return min(selectivity, 1.0)
+
+if __name__ == "__main__":
+    import argparse
+    import yaml
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", type=str, default="rl_query_optimizer/config.yaml")
+    parser.add_argument("--out", type=str, default="rl_query_optimizer/data/job_stats.json.gz")
+    parser.add_argument("--schema", type=str, default="public")
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    snapshot = export_stats_snapshot(config['database'], args.out, schema=args.schema)
+    print(f"Wrote statistics for {len(snapshot['tables'])} tables to {args.out}")
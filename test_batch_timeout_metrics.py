@@ -0,0 +1,66 @@
+import threading
+from rl_query_optimizer.env.cost_interface import CostInterface
+from rl_query_optimizer.env.backends.base import CostBackend
+
+class SlowBackend(CostBackend):
+    """
+    EXPLAIN that blocks until cancel() is called for its thread, then fails
+    like a cancelled statement (or fails right away with block off).
+    """
+
+    def __init__(self):
+        self.block = True
+        self.cancelled = {}
+        self.lock = threading.Lock()
+
+    def explain(self, query, join_order=None, analyze=False, timeout_ms=None, settings=None):
+        if not self.block:
+            raise RuntimeError("relation does not exist")
+        event = threading.Event()
+        with self.lock:
+            self.cancelled[threading.get_ident()] = event
+        if not event.wait(5):
+            raise AssertionError("explain was never cancelled")
+        raise RuntimeError("canceling statement due to user request")
+
+    def cancel(self, thread_id):
+        with self.lock:
+            event = self.cancelled.get(thread_id)
+        if event is not None:
+            event.set()
+
+def make_interface():
+    db_config = {'dbname': 'imdb', 'user': 'u', 'password': 'p', 'host': 'localhost', 'port': 5432}
+    cost_interface = CostInterface(db_config, {'backend': 'simulated'})
+    cost_interface.backend = SlowBackend()
+    cost_interface._connected = True
+    return cost_interface
+
+def test_timed_out_call_counted_once():
+    cost_interface = make_interface()
+    try:
+        sql = "SELECT * FROM title t, movie_info mi WHERE t.id = mi.movie_id"
+        costs = cost_interface.estimate_costs([(['t', 'mi'], sql)], concurrency=1, timeout=0.05)
+        assert costs == [CostInterface.FAILURE_PENALTY]
+        counters = cost_interface.metrics.snapshot()['counters']
+        assert counters.get('timeouts') == 1
+        assert counters.get('penalties') == 1
+        assert counters.get('failures', 0) == 0
+    finally:
+        cost_interface.close()
+
+def test_failure_after_timeout_still_counted():
+    cost_interface = make_interface()
+    try:
+        sql = "SELECT * FROM title t, movie_info mi WHERE t.id = mi.movie_id"
+        cost_interface.estimate_costs([(['t', 'mi'], sql)], concurrency=1, timeout=0.05)
+        cost_interface.metrics.reset()
+        # The same worker thread fails on its own later: a regular failure
+        cost_interface.backend.block = False
+        cost_interface.estimate_costs([(['mi', 't'], sql)], concurrency=1, timeout=1.0)
+        counters = cost_interface.metrics.snapshot()['counters']
+        assert counters.get('timeouts', 0) == 0
+        assert counters.get('failures') == 1
+        assert counters.get('penalties') == 1
+    finally:
+        cost_interface.close()
@@ -0,0 +1,44 @@
+import threading
+import time
+from rl_query_optimizer.env.cost_interface import CostInterface
+
+SQL = "SELECT * FROM title t, movie_info mi, cast_info ci WHERE t.id = mi.movie_id AND t.id = ci.movie_id"
+
+def test_interleaved_batches_with_growing_concurrency():
+    db_config = {'dbname': 'imdb', 'user': 'u', 'password': 'p', 'host': 'localhost', 'port': 5432}
+    cost_interface = CostInterface(db_config, {'backend': 'simulated', 'batch': {'concurrency': 1}})
+    explain = cost_interface.backend.explain
+
+    def slow_explain(*args, **kwargs):
+        time.sleep(0.002)
+        return explain(*args, **kwargs)
+
+    cost_interface.backend.explain = slow_explain
+    errors = []
+    results = []
+
+    def caller(index):
+        try:
+            for round_ in range(5):
+                # Every round some callers ask for more threads than the pool has
+                concurrency = 1 + (index + round_ * 7) % 12
+                requests = [(['t', 'mi', 'ci'], SQL), (['mi', 't', 'ci'], SQL), (['ci', 't', 'mi'], SQL)] * 2
+                results.append(cost_interface.estimate_costs(requests, concurrency=concurrency))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(12)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors, errors
+        assert len(results) == 60
+        assert all(cost != CostInterface.FAILURE_PENALTY for costs in results for cost in costs)
+        counters = cost_interface.metrics.snapshot()['counters']
+        assert counters.get('failures', 0) == 0
+        # Only the current executor is left once no call holds a replaced one
+        assert not cost_interface._executor_users
+    finally:
+        cost_interface.close()
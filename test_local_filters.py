@@ -0,0 +1,57 @@
+import gzip
+import json
+import pytest
+from rl_query_optimizer.utils.sql_parser import parse_sql
+from rl_query_optimizer.utils.stats_snapshot import CardinalityEstimator
+from rl_query_optimizer.env.backends.simulated import SimulatedBackend
+
+QUERY = """
+SELECT MIN(t.title)
+FROM title AS t, movie_companies AS mc, company_type AS ct
+WHERE t.production_year BETWEEN 2000 AND 2010
+  AND mc.note IS NULL
+  AND ct.kind IN ('production companies', 'distributors')
+  AND t.id = mc.movie_id
+  AND ct.id = mc.company_type_id
+"""
+
+def column(null_frac=0.0, n_distinct=-1.0, mcv=(), mcf=(), histogram=()):
+    return {"null_frac": null_frac, "n_distinct": n_distinct, "mcv": list(mcv), "mcf": list(mcf), "histogram": list(histogram)}
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    tables = {
+        "title": {"rows": 1000.0, "pages": 10, "indexes": [], "columns": {
+            "id": column(),
+            "production_year": column(n_distinct=100.0, histogram=[1900, 1950, 2000, 2050])
+        }},
+        "movie_companies": {"rows": 4000.0, "pages": 40, "indexes": [], "columns": {
+            "movie_id": column(n_distinct=1000.0),
+            "company_type_id": column(n_distinct=4.0),
+            "note": column(null_frac=0.25)
+        }},
+        "company_type": {"rows": 4.0, "pages": 1, "indexes": [], "columns": {
+            "id": column(),
+            "kind": column(n_distinct=-1.0, mcv=["production companies", "distributors"], mcf=[0.25, 0.25])
+        }}
+    }
+    path = tmp_path / "snapshot.json.gz"
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump({"schema": "public", "version": "v1", "tables": tables}, f)
+    return str(path)
+
+def test_estimate_join_applies_between_in_and_null_filters(snapshot_path):
+    estimator = CardinalityEstimator(snapshot_path)
+    parsed = parse_sql(QUERY)
+    # BETWEEN 2000 AND 2010 covers a fifth of the last histogram bucket
+    assert estimator.estimate_join(parsed, ['t']) == pytest.approx(1000.0 * (1 / 3) * 0.2)
+    assert estimator.estimate_join(parsed, ['mc']) == pytest.approx(4000.0 * 0.25)
+    assert estimator.estimate_join(parsed, ['ct']) == pytest.approx(4.0 * 0.5)
+
+def test_simulated_backend_applies_between_in_and_null_filters(snapshot_path):
+    backend = SimulatedBackend({"snapshot_path": snapshot_path})
+    relations, _ = backend._query_info(QUERY)
+    estimator = backend.estimator
+    assert relations['t']['rows'] == pytest.approx(estimator.estimate_table('title', ["t.production_year BETWEEN 2000 AND 2010"]))
+    assert relations['mc']['rows'] == pytest.approx(1000.0)
+    assert relations['ct']['rows'] == pytest.approx(2.0)
@@ -0,0 +1,61 @@
+import psycopg2
+from rl_query_optimizer.env.cost_interface import CostInterface
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.sql = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.sql = sql
+
+    def fetchone(self):
+        if 'last_analyze' in self.sql:
+            # Timestamp-based version: differs per replica
+            return (f"analyzed-on-{self.conn.host}",)
+        if 'pg_stats' in self.sql:
+            return ("same-statistics",)
+        if 'md5' in self.sql:
+            return ("same-schema",)
+        return (1,)
+
+class FakeConnection:
+    def __init__(self, host):
+        self.host = host
+        self.closed = 0
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+def test_stats_version_stable_across_replicas(monkeypatch):
+    monkeypatch.setattr(psycopg2, 'connect', lambda **kwargs: FakeConnection(kwargs['host']))
+    db_config = {
+        'dbname': 'imdb', 'user': 'u', 'password': 'p', 'host': 'a', 'port': 5432,
+        'pool': {'min_size': 1, 'max_size': 2},
+        'replicas': [{'host': 'a'}, {'host': 'b'}]
+    }
+    cost_interface = CostInterface(db_config, {'cache': {'enabled': True}})
+    cost_interface.connect()
+    try:
+        assert all(not r['mismatched'] for r in cost_interface.backend.stats()['replicas'])
+        cost_interface.cache.put('key', 42.0)
+        versions = set()
+        for _ in range(6):
+            cost_interface.refresh_stats_version()
+            versions.add(cost_interface.stats_version)
+        served = [r['served'] for r in cost_interface.backend.stats()['replicas']]
+        assert all(count > 0 for count in served), served
+        assert versions == {"same-statistics"}
+        assert cost_interface.cache.get('key') == 42.0
+    finally:
+        cost_interface.close()
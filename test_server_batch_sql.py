@@ -0,0 +1,21 @@
+import re
+from rl_query_optimizer.env.backends.postgres import SERVER_BATCH_SQL
+
+def separator_value(token):
+    """
+    Value PostgreSQL gives the SQL expression between hint and query.
+    """
+    if token == "chr(10)":
+        return "\n"
+    if token.startswith("E'"):
+        return token[2:-1].encode('utf-8').decode('unicode_escape')
+    return token[1:-1]
+
+def test_hint_and_query_separated_by_newline():
+    match = re.search(r"EXECUTE 'EXPLAIN \(FORMAT JSON\) ' \|\| hint \|\| (.+?) \|\| query INTO plan;", SERVER_BATCH_SQL)
+    assert match, SERVER_BATCH_SQL
+    assert separator_value(match.group(1)) == "\n"
+
+if __name__ == "__main__":
+    test_hint_and_query_separated_by_newline()
+    print("SERVER_BATCH_SQL separates hint and query with a newline")